@@ -0,0 +1,211 @@
+import asyncio
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from detection import metrics
+from detection.ingest import PDF_MAX_PAGES
+
+UNIT_BYTES = 4 * 1024 * 1024  # upload bytes that count as one unit of capacity
+QUEUE_LIMIT = 16
+QUEUE_TIMEOUT = 30  # seconds a request may wait for capacity
+PER_USER = 2  # analyses running or queued per user
+RETRY_AFTER_MAX = 60
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+class AdmissionRejected(Exception):
+    """An upload turned away before analysis: 429 for a user over their cap, 503 when the server is full."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def estimated_pages(pages):
+    """Pages a PDF request will render, without opening the document ('all' counts as the page cap)."""
+    pages = str(pages or 'first').strip().lower()
+    if pages == 'first':
+        return 1
+    if pages == 'all':
+        return getattr(settings, 'DETECTION_PDF_MAX_PAGES', PDF_MAX_PAGES)
+    return max(1, len({p for p in pages.split(',') if p.strip()}))
+
+
+def request_weight(size, content_type, pages=None):
+    """Capacity units an upload takes: one per UNIT_BYTES, and at least one per PDF page rendered."""
+    unit = getattr(settings, 'DETECTION_ADMISSION_UNIT_BYTES', UNIT_BYTES)
+    weight = max(1, math.ceil(size / unit))
+    if content_type == 'application/pdf':
+        weight = max(weight, estimated_pages(pages))
+    return weight
+
+
+class AdmissionController:
+    """Weighted concurrency limit for analyses in this process, with a bounded FIFO queue.
+
+    A request runs once its weight fits in the free capacity and everyone
+    queued before it has started, so heavy documents are not starved by a
+    stream of small ones. A request heavier than the whole capacity runs alone.
+    """
+
+    def __init__(self, capacity, queue_limit=QUEUE_LIMIT, timeout=QUEUE_TIMEOUT, per_user=PER_USER):
+        self.capacity = capacity
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.per_user = per_user
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._running = 0
+        self._queue = deque()  # [ticket, weight] in arrival order
+        self._users = {}  # user id -> analyses running or queued
+        self._unit_seconds = 1.0  # moving average of analysis time per unit of weight, for Retry-After
+        self.admitted = self.rejected = 0
+
+    def acquire(self, weight, user=None):
+        """Block until the request may run; returns the weight to pass to release()."""
+        weight = max(1, min(weight, self.capacity))
+        with self._cond:
+            if user is not None and self.per_user and self._users.get(user, 0) >= self.per_user:
+                raise self._reject("Too many analyses in progress for this user.", 429, 'user')
+            if not self._queue and self._in_use + weight <= self.capacity:
+                self._start(weight, user)
+                return weight
+            if len(self._queue) >= self.queue_limit:
+                raise self._reject("Server is busy; try again later.", 503, 'queue_full')
+
+            entry = [object(), weight]
+            self._queue.append(entry)
+            self._track(user, 1)
+            deadline = time.monotonic() + self.timeout
+            while self._queue[0] is not entry or self._in_use + weight > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(entry)
+                    self._track(user, -1)
+                    self._cond.notify_all()  # whoever was behind us may be at the head now
+                    raise self._reject("Timed out waiting for analysis capacity.", 503, 'timeout')
+                self._cond.wait(remaining)
+            self._queue.popleft()
+            self._track(user, -1)
+            self._start(weight, user)
+            self._cond.notify_all()  # the next in line may fit as well
+            return weight
+
+    def release(self, weight, user=None, elapsed=None):
+        with self._cond:
+            self._in_use -= weight
+            self._running -= 1
+            self._track(user, -1)
+            if elapsed is not None:
+                self._unit_seconds = 0.8 * self._unit_seconds + 0.2 * elapsed / weight
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """Seconds until the work ahead of a new request should have drained."""
+        backlog = self._in_use + sum(weight for _, weight in self._queue)
+        return min(RETRY_AFTER_MAX, max(1, math.ceil(self._unit_seconds * backlog / self.capacity)))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'capacity': self.capacity,
+                'in_use': self._in_use,
+                'running': self._running,
+                'queued': len(self._queue),
+                'queued_weight': sum(weight for _, weight in self._queue),
+                'queue_limit': self.queue_limit,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'retry_after': self.retry_after(),
+            }
+
+    def _start(self, weight, user):
+        self._in_use += weight
+        self._running += 1
+        self._track(user, 1)
+        self.admitted += 1
+
+    def _track(self, user, delta):
+        if user is None:
+            return
+        count = self._users.get(user, 0) + delta
+        if count > 0:
+            self._users[user] = count
+        else:
+            self._users.pop(user, None)
+
+    def _reject(self, message, status, reason):
+        self.rejected += 1
+        metrics.admission_rejections.inc(reason=reason)
+        return AdmissionRejected(message, status, self.retry_after())
+
+
+def get_controller():
+    """This process's controller, or None when DETECTION_ADMISSION_CAPACITY is 0."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                capacity = getattr(settings, 'DETECTION_ADMISSION_CAPACITY', None)
+                if capacity is None:
+                    capacity = os.cpu_count() or 1
+                _controller = AdmissionController(
+                    capacity,
+                    queue_limit=getattr(settings, 'DETECTION_ADMISSION_QUEUE', QUEUE_LIMIT),
+                    timeout=getattr(settings, 'DETECTION_ADMISSION_TIMEOUT', QUEUE_TIMEOUT),
+                    per_user=getattr(settings, 'DETECTION_ADMISSION_PER_USER', PER_USER),
+                ) if capacity else False
+    return _controller or None
+
+
+@contextlib.contextmanager
+def admit(weight, user=None, trace=metrics.NULL_TRACE):
+    """Hold a share of this process's analysis capacity; raises AdmissionRejected."""
+    controller = get_controller()
+    if controller is None:
+        yield
+        return
+    with trace.span('admission'):
+        weight = controller.acquire(weight, user)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        controller.release(weight, user, time.monotonic() - started)
+
+
+@contextlib.asynccontextmanager
+async def aadmit(weight, user=None, trace=metrics.NULL_TRACE):
+    """admit() for async views; the wait happens in a thread, not on the event loop."""
+    controller = get_controller()
+    if controller is None:
+        yield
+        return
+    with trace.span('admission'):
+        waiting = asyncio.get_running_loop().run_in_executor(None, controller.acquire, weight, user)
+        try:
+            weight = await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # Client went away: give the capacity back whenever the wait ends
+            waiting.add_done_callback(
+                lambda f: f.cancelled() or f.exception() or controller.release(f.result(), user))
+            raise
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        controller.release(weight, user, time.monotonic() - started)
+
+
+def stats():
+    controller = get_controller()
+    return controller.stats() if controller is not None else {'capacity': 0}
@@ -0,0 +1,250 @@
+import io
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from detection import copy_move, feature_store
+from detection.context import AnalysisContext
+
+RESOLUTIONS = {
+    'small': (1000, 630),
+    'medium': (2000, 1260),
+    'large': (4000, 2520),
+    'xlarge': (8000, 5040),
+}
+VARIANTS = ('clean', 'copy_move', 'splice', 'recompressed')
+MIN_DELTA_MS = 2.0  # p50 slowdowns smaller than this are timer noise, whatever the ratio
+CHECK_METHODS = (
+    'error_level_analysis',
+    'detect_copy_move',
+    'check_text_consistency',
+    'analyze_noise_patterns',
+    'check_compression',
+    'check_edge_consistency',
+    'count_keypoints',
+)
+METHODS = CHECK_METHODS + ('classify_with_model', 'detect_tampering')
+
+
+def make_id_card(seed, width, height):
+    """Draw a deterministic, ID-card-like BGR image (header, photo, text, barcode)."""
+    rng = np.random.default_rng(seed)
+    unit = width / 1000
+
+    gradient = np.linspace(215, 245, width, dtype=np.float32)
+    card = np.repeat(np.repeat(gradient[None, :, None], height, axis=0), 3, axis=2)
+    card += rng.normal(0, 3, card.shape).astype(np.float32)
+    card = np.clip(card, 0, 255).astype(np.uint8)
+
+    header = tuple(int(c) for c in rng.integers(60, 200, 3))
+    cv2.rectangle(card, (0, 0), (width, int(90 * unit)), header, -1)
+    cv2.putText(card, "GOVERNMENT OF SYNTHETICA", (int(30 * unit), int(60 * unit)),
+                cv2.FONT_HERSHEY_DUPLEX, 1.2 * unit, (255, 255, 255), max(1, int(2 * unit)))
+
+    # Photo: blurred texture with a face-like ellipse
+    x0, y0, pw, ph = int(40 * unit), int(130 * unit), int(260 * unit), int(330 * unit)
+    texture = cv2.GaussianBlur(rng.random((ph, pw)).astype(np.float32), (0, 0), 3 * unit)
+    texture = cv2.normalize(texture, None, 70, 200, cv2.NORM_MINMAX).astype(np.uint8)
+    photo = cv2.merge([texture, (texture * 0.9).astype(np.uint8), (texture * 0.8).astype(np.uint8)])
+    cv2.ellipse(photo, (pw // 2, ph // 2), (pw // 4, ph // 3), 0, 0, 360, (150, 170, 210), -1)
+    card[y0:y0 + ph, x0:x0 + pw] = photo
+
+    fields = ["Name", "Father", "DOB", "Gender", "ID No", "Address"]
+    for i, field in enumerate(fields):
+        value = ''.join(rng.choice(list("ABCDEFGHJKLMNPRSTUVWXYZ0123456789"), 12))
+        cv2.putText(card, f"{field}: {value}", (int(340 * unit), int((170 + i * 60) * unit)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9 * unit, (25, 25, 25), max(1, int(2 * unit)))
+
+    bars = rng.integers(0, 2, 120).astype(bool)
+    bar_w = max(1, int(3 * unit))
+    for i, bar in enumerate(bars):
+        if bar:
+            x = int(340 * unit) + i * bar_w
+            cv2.rectangle(card, (x, int(530 * unit)), (x + bar_w - 1, int(600 * unit)), (0, 0, 0), -1)
+    return card
+
+
+def encode_jpeg(bgr, quality=90):
+    return cv2.imencode('.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def tamper(card, variant, seed):
+    rng = np.random.default_rng(seed + 1000)
+    height, width = card.shape[:2]
+    forged = card.copy()
+    if variant == 'copy_move':
+        # Duplicate part of the photo over the text block
+        ph, pw = height // 6, width // 8
+        sy, sx = int(height * 0.25), int(width * 0.06)
+        dy, dx = int(height * 0.55), int(width * 0.6)
+        forged[dy:dy + ph, dx:dx + pw] = card[sy:sy + ph, sx:sx + pw]
+    elif variant == 'splice':
+        # Paste a region from a different card that went through another compression history
+        donor = make_id_card(seed + 1, width, height)
+        donor = cv2.imdecode(np.frombuffer(encode_jpeg(donor, 60), np.uint8), cv2.IMREAD_COLOR)
+        ph, pw = height // 5, width // 4
+        y, x = int(rng.integers(height // 3, height - ph)), int(rng.integers(width // 3, width - pw))
+        forged[y:y + ph, x:x + pw] = donor[y:y + ph, x:x + pw]
+    elif variant == 'recompressed':
+        forged = cv2.imdecode(np.frombuffer(encode_jpeg(card, 70), np.uint8), cv2.IMREAD_COLOR)
+    return forged
+
+
+def make_pdf(bgr, pages=1):
+    image = Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+    out = io.BytesIO()
+    image.save(out, 'PDF', resolution=200.0, save_all=True, append_images=[image] * (pages - 1))
+    return out.getvalue()
+
+
+def build_corpus(resolutions=('small', 'medium', 'large'), seed=0, pdfs=True):
+    """Return deterministic samples: dicts with name, content_type and data."""
+    corpus = []
+    for size in resolutions:
+        width, height = RESOLUTIONS[size]
+        card = make_id_card(seed, width, height)
+        for variant in VARIANTS:
+            corpus.append({
+                'name': f'{size}-{variant}.jpg',
+                'content_type': 'image/jpeg',
+                'data': encode_jpeg(tamper(card, variant, seed)),
+            })
+        if pdfs:
+            corpus.append({'name': f'{size}-clean.pdf', 'content_type': 'application/pdf', 'data': make_pdf(card)})
+            corpus.append({'name': f'{size}-3page.pdf', 'content_type': 'application/pdf', 'data': make_pdf(card, 3)})
+    return corpus
+
+
+def summarize(latencies, peak_bytes):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'runs': int(len(latencies)),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p90_ms': round(float(np.percentile(latencies, 90)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'peak_mb': round(peak_bytes / 2 ** 20, 2),
+    }
+
+
+def measure(fn, repeat):
+    """Time ``fn`` ``repeat`` times after one warm-up run, then trace its peak allocation once.
+
+    tracemalloc sees every NumPy/OpenCV output array but not OpenCV's internal
+    scratch buffers, so peak_mb is a lower bound on the real peak.
+    """
+    fn()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(latencies, peak)
+
+
+def run(corpus, methods=METHODS, repeat=5, mode='thorough'):
+    from detection.cache import result_cache
+    from detection.views import UploadView
+
+    view = UploadView()
+    results = {}
+    alias, result_cache.alias = result_cache.alias, None  # time the pipeline, not the cache
+    try:
+        for sample in corpus:
+            if sample['content_type'] == 'application/pdf':
+                pages = 'all' if '3page' in sample['name'] else 'first'
+                fn = lambda s=sample, p=pages: view.analyze_bytes(s['data'], s['content_type'], s['name'],
+                                                                  pages=p, mode=mode)
+                results[f"analyze_pdf|{sample['name']}"] = _safe_measure(fn, repeat)
+                continue
+
+            ctx = AnalysisContext(sample['data'], name=sample['name'])
+            ctx.bgr, ctx.gray  # checks are timed on an already decoded image
+            features = None
+            for method in methods:
+                if method == 'detect_tampering':
+                    fn = lambda s=sample: view.detect_tampering(AnalysisContext(s['data'], name=s['name']), mode)
+                elif method == 'classify_with_model':
+                    features = features or _features(view, sample)
+                    fn = lambda f=features: view.classify_with_model(f)
+                else:
+                    fn = lambda m=getattr(view, method): m(ctx)
+                results[f"{method}|{sample['name']}"] = _safe_measure(fn, repeat)
+    finally:
+        result_cache.alias = alias
+    return results
+
+
+def calibrate_keypoints(resolutions=('medium', 'large', 'xlarge'), seeds=3, max_pixels=2_560_000):
+    """Fit copy_move.KEYPOINT_EXPONENT: least squares of log(native / working) on log(pixel ratio).
+
+    Returns (exponent, mean relative error of the fitted estimate) over every
+    variant of ``seeds`` cards at each resolution.
+    """
+    ratios, counts = [], []
+    for size in resolutions:
+        width, height = RESOLUTIONS[size]
+        for seed in range(seeds):
+            card = make_id_card(seed, width, height)
+            for variant in VARIANTS:
+                jpeg = np.frombuffer(encode_jpeg(tamper(card, variant, seed)), np.uint8)
+                gray = cv2.imdecode(jpeg, cv2.IMREAD_GRAYSCALE)
+                image, _ = copy_move.working_image(gray, max_pixels)
+                working = len(cv2.SIFT_create().detect(image, None))
+                native = copy_move.native_keypoints(gray, image, (), 0)
+                ratios.append(np.log(gray.size / image.size))
+                counts.append(np.log(native / working))
+    ratios, counts = np.array(ratios), np.array(counts)
+    exponent = float(ratios @ counts / (ratios @ ratios))
+    error = float(np.abs(np.exp(counts - exponent * ratios) - 1).mean())
+    return round(exponent, 3), round(error, 3)
+
+
+def _features(view, sample):
+    results = view.detect_tampering(AnalysisContext(sample['data'], name=sample['name']), 'thorough')
+    return feature_store.from_checks(results['checks'])
+
+
+def _safe_measure(fn, repeat):
+    try:
+        return measure(fn, repeat)
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def compare(current, baseline, tolerance=0.2, min_delta_ms=MIN_DELTA_MS):
+    """Return (key, baseline p50, current p50, ratio) for every p50 that regressed beyond ``tolerance``.
+
+    A slowdown must also exceed ``min_delta_ms``: sub-millisecond timings
+    swing by more than any sensible ratio between two runs of the same code.
+    """
+    regressions = []
+    for key, stats in current.items():
+        before = baseline.get(key)
+        if not before or 'p50_ms' not in before or 'p50_ms' not in stats:
+            continue
+        ratio = stats['p50_ms'] / max(before['p50_ms'], 1e-6)
+        if ratio > 1 + tolerance and stats['p50_ms'] - before['p50_ms'] > min_delta_ms:
+            regressions.append((key, before['p50_ms'], stats['p50_ms'], round(ratio, 2)))
+    return regressions
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+
+from detection.registry import model_registry
+
+# Bump whenever a change to the checks or the scoring changes what
+# detect_tampering returns for the same bytes, so stale entries stop matching.
+PIPELINE_VERSION = 15
+
+
+class ResultCache:
+    """Content-addressed cache of detection results in front of the pipeline.
+
+    Entries live in one of Django's cache backends (see CACHES in settings),
+    so size bounds, TTL and eviction come from the configured backend:
+    LocMemCache evicts LRU, FileBasedCache culls the oldest files.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if not self.alias:
+            return None
+        try:
+            return caches[self.alias]
+        except InvalidCacheBackendError:
+            return None
+
+    def key(self, data, **options):
+        digest = hashlib.sha256(data).hexdigest()
+        variant = ','.join(f'{k}={v}' for k, v in sorted(options.items()))
+        return f'detect:{PIPELINE_VERSION}:{model_registry.version[:16]}:{variant}:{digest}'
+
+    def get(self, key):
+        backend = self.backend
+        if backend is None:
+            return None
+        value = backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, results):
+        backend = self.backend
+        # Errors and timed-out checks are transient; let the next attempt recompute
+        if backend is None or 'error' in results or results.get('degraded_checks'):
+            return
+        backend.set(key, results)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'backend': self.alias,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0,
+        }
+
+
+result_cache = ResultCache(getattr(settings, 'DETECTION_RESULT_CACHE_ALIAS', 'detection_results'))
@@ -0,0 +1,100 @@
+import os
+import threading
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from detection.ingest import BufferReader
+from detection.metrics import NULL_TRACE
+from detection.resolution import working_scale
+
+
+class AnalysisContext:
+    """Per-request view of an upload: raw bytes read once, decoded views built lazily.
+
+    Each view is computed at most once, even when several checks ask for it
+    from different threads at the same time.
+    """
+
+    def __init__(self, data, name=None, trace=None, rendered=False):
+        self.data = data
+        self.name = name
+        self.trace = trace or NULL_TRACE
+        self.rendered = rendered  # a PDF page we rasterized, so its encoding is ours
+        self._views = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @classmethod
+    def from_path(cls, path, trace=None):
+        with open(path, 'rb') as f:
+            return cls(f.read(), name=os.path.basename(path), trace=trace)
+
+    def _view(self, key, build):
+        try:
+            return self._views[key]
+        except KeyError:
+            pass
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._views:
+                self._views[key] = build()
+            return self._views[key]
+
+    def stream(self):
+        """A file over ``data`` that does not copy it, so a mapped upload stays off the heap."""
+        return BufferReader(self.data)
+
+    @property
+    def bgr(self):
+        return self._view('bgr', self._decode_bgr)
+
+    @property
+    def gray(self):
+        return self._view('gray', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def luma(self):
+        """Grayscale on the file's own pixel grid: EXIF orientation is not applied."""
+        return self._view('luma', lambda: cv2.imdecode(
+            np.frombuffer(self.data, np.uint8), cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION))
+
+    @property
+    def header(self):
+        return self._view('header', lambda: Image.open(self.stream()))
+
+    @property
+    def pil(self):
+        return self._view('pil', self._open_pil)
+
+    def scaled(self, view, max_pixels):
+        """Return ``(image, scale)`` for a view shrunk to at most ``max_pixels``.
+
+        Checks that share a pixel budget share the resized copy.
+        """
+        image = getattr(self, view)
+        scale = working_scale(image.shape, max_pixels)
+        if scale >= 1.0:
+            return image, 1.0
+        resized = self._view((view, round(scale, 4)), lambda: cv2.resize(
+            image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+        return resized, scale
+
+    def _decode_bgr(self):
+        img = cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Could not decode image.")
+        return img
+
+    def _open_pil(self):
+        img = Image.open(self.stream())
+        img.load()
+        return img
+
+    def release(self):
+        header = self._views.get('header')
+        if getattr(header, 'fp', None) is not None:
+            header.fp.close()  # the header never loads pixels, so PIL keeps its stream open
+        self._views.clear()
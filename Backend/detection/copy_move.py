@@ -0,0 +1,233 @@
+import numpy as np
+import cv2
+from django.conf import settings
+
+from detection.ocr import find_text_regions
+from detection.resolution import working_scale
+
+KEYPOINTS_PER_MP = 2000  # keypoint budget per working megapixel ...
+MIN_KEYPOINTS = 500
+MAX_KEYPOINTS = 4000  # ... clamped to this range
+RATIO = 0.6  # 2nd-nearest-neighbour ratio test
+# Distances are fractions of the working image's longer side, so they mean the
+# same thing whether the upload was 0.5 MP or 48 MP.
+MIN_DISTANCE = 0.02  # between a keypoint and its copy
+CLUSTER_RADIUS = 0.025  # pairs closer than this with similar shifts form one region
+MIN_CLUSTER = 7  # matched pairs needed to report a duplicated region
+MIN_REGION_SIDE = 0.03  # shorter side of a region's box; single glyphs are smaller
+MIN_SHIFT = 0.05  # between a region and its copy
+PERIODIC_CLUSTERS = 3  # this many regions sharing one shift are a repeating pattern (text lines, guilloche)
+MAX_PAIRS = 1500
+# The classifier was trained on uncapped native-resolution SIFT counts, which
+# grow far slower than the pixel count: native ~ working * (pixel ratio) ** this.
+# Fitted on the benchmark corpus at the default 2.56 MP (benchmarks.calibrate_keypoints).
+KEYPOINT_EXPONENT = 0.13
+NATIVE_TILE = 2048  # the opt-in native recount reads tiles this size ...
+NATIVE_OVERLAP = 128  # ... each with this much margin
+MAX_REGIONS = 10
+
+
+def _setting(name, default):
+    return getattr(settings, f'DETECTION_COPY_MOVE_{name}', default)
+
+
+def working_image(gray, max_pixels):
+    """Walk down a Gaussian pyramid until the image fits ``max_pixels``; returns (image, scale)."""
+    image, scale = gray, 1.0
+    if not max_pixels:
+        return image, scale
+    while image.shape[0] * image.shape[1] > 4 * max_pixels:
+        image = cv2.pyrDown(image)
+        scale /= 2
+    factor = working_scale(image.shape, max_pixels)
+    if factor < 1.0:
+        image = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        scale *= factor
+    return image, scale
+
+
+def keypoint_budget(shape):
+    megapixels = shape[0] * shape[1] / 1e6
+    return int(np.clip(KEYPOINTS_PER_MP * megapixels, MIN_KEYPOINTS, _setting('MAX_KEYPOINTS', MAX_KEYPOINTS)))
+
+
+def match_self(descriptors, points, ratio, min_distance):
+    """Match every descriptor against the rest of the same image.
+
+    Uses a FLANN kd-tree (approximate nearest neighbours) with k=3 so that the
+    keypoint itself can be skipped and the g2NN ratio test still applied.
+    Returns index pairs (i < j) and their distance ratios.
+    """
+    index = cv2.flann_Index(descriptors, {'algorithm': 1, 'trees': 4})
+    neighbours, distances = index.knnSearch(descriptors, 3, params={'checks': 64})
+    distances = np.sqrt(np.maximum(distances, 0))  # kd-tree reports squared L2
+
+    rows = np.arange(len(descriptors))
+    first_is_self = neighbours[:, 0] == rows
+    nearest = np.where(first_is_self, neighbours[:, 1], neighbours[:, 0])
+    d1 = np.where(first_is_self, distances[:, 1], distances[:, 0])
+    d2 = np.where(first_is_self, distances[:, 2], distances[:, 1])
+
+    ratios = d1 / np.maximum(d2, 1e-6)
+    far_enough = np.linalg.norm(points[rows] - points[nearest], axis=1) > min_distance
+    keep = (ratios < ratio) & far_enough & (rows < nearest)
+    pairs = np.stack([rows[keep], nearest[keep]], axis=1)
+    ratios = ratios[keep]
+
+    order = np.argsort(ratios)[:MAX_PAIRS]
+    return pairs[order], ratios[order]
+
+
+def cluster_pairs(src, dst, radius):
+    """Group pairs whose sources are close and whose shift vectors agree.
+
+    Connected components over the pair adjacency matrix, found by vectorised
+    min-label propagation (at most a few iterations for compact regions).
+    """
+    shift = dst - src
+    near = np.linalg.norm(src[:, None] - src[None], axis=2) < radius
+    same_shift = np.linalg.norm(shift[:, None] - shift[None], axis=2) < radius / 2
+    adjacency = near & same_shift
+
+    labels = np.arange(len(src))
+    while True:
+        updated = np.where(adjacency, labels[None, :], len(src)).min(axis=1)
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def in_boxes(points, boxes):
+    """Whether each point falls inside any of the ``(x, y, w, h)`` boxes."""
+    inside = np.zeros(len(points), dtype=bool)
+    for x, y, w, h in boxes:
+        inside |= ((points[:, 0] >= x) & (points[:, 0] < x + w) & (points[:, 1] >= y) & (points[:, 1] < y + h))
+    return inside
+
+
+def periodic(shifts, radius):
+    """Flag clusters whose shift is shared by PERIODIC_CLUSTERS or more clusters.
+
+    A cloned region has one copy; text lines and printed patterns repeat
+    with the same pitch all over the document.
+    """
+    if not len(shifts):
+        return np.zeros(0, dtype=bool)
+    shifts = np.float32(shifts)
+    same = np.linalg.norm(shifts[:, None] - shifts[None], axis=2) < radius
+    return same.sum(axis=1) >= PERIODIC_CLUSTERS
+
+
+def _box(points):
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    return [int(x0), int(y0), int(x1 - x0), int(y1 - y0)]
+
+
+def native_keypoints(gray, image, keypoints, budget):
+    """SIFT keypoint count on the full-resolution image with no cap, the classifier's training basis.
+
+    Several times the cost of the whole check on large uploads, so
+    model_keypoints only calls it when DETECTION_COPY_MOVE_NATIVE_KEYPOINTS
+    is set.
+
+    Equal to the working count when the image was not shrunk and the budget
+    was not reached. Otherwise SIFT runs again, tile by tile, so memory stays
+    bounded on large uploads; each keypoint is counted in the tile whose core
+    holds it, which matches a whole-image count to within a few tenths of a
+    percent.
+    """
+    if image.shape == gray.shape and len(keypoints) < budget:
+        return len(keypoints)
+    sift = cv2.SIFT_create()
+    height, width = gray.shape
+    count = 0
+    for y in range(0, height, NATIVE_TILE):
+        for x in range(0, width, NATIVE_TILE):
+            y0, x0 = max(0, y - NATIVE_OVERLAP), max(0, x - NATIVE_OVERLAP)
+            tile = gray[y0:y + NATIVE_TILE + NATIVE_OVERLAP, x0:x + NATIVE_TILE + NATIVE_OVERLAP]
+            points = np.float32([kp.pt for kp in sift.detect(tile, None)]).reshape(-1, 2) + (x0, y0)
+            count += int(in_boxes(points, [(x, y, NATIVE_TILE, NATIVE_TILE)]).sum())
+    return count
+
+
+def model_keypoints(gray, image, keypoints, budget):
+    """The classifier's keypoint feature, estimated from the working image's SIFT count.
+
+    The working count is rescaled by the pixel ratio (KEYPOINT_EXPONENT);
+    on the benchmark corpus the estimate is within about 7% of the native
+    count on average. Only when the budget capped the working count does
+    SIFT run again, uncapped, on the working image.
+    """
+    if _setting('NATIVE_KEYPOINTS', False):
+        return native_keypoints(gray, image, keypoints, budget)
+    count = len(keypoints) if len(keypoints) < budget else len(cv2.SIFT_create().detect(image, None))
+    if image.shape == gray.shape:
+        return count
+    return int(round(count * (gray.size / image.size) ** KEYPOINT_EXPONENT))
+
+
+def count_keypoints(gray, max_pixels=None):
+    """model_keypoints on its own, for uploads whose copy-move check does not run."""
+    image, _ = working_image(gray, max_pixels)
+    return model_keypoints(gray, image, (), 0)
+
+
+def detect(gray, max_pixels=None):
+    image, scale = working_image(gray, max_pixels)
+    side = max(image.shape)
+    budget = keypoint_budget(image.shape)
+    sift = cv2.SIFT_create(nfeatures=budget)
+    keypoints, descriptors = sift.detectAndCompute(image, None)
+
+    result = {
+        'keypoints': len(keypoints),
+        'model_keypoints': model_keypoints(gray, image, keypoints, budget),
+        'matches': 0,
+        'regions': [],
+        'has_copy_move': False,
+        'working_scale': round(scale, 4),
+    }
+    if descriptors is None or len(keypoints) < 3:
+        return result
+
+    points = np.float32([kp.pt for kp in keypoints])
+    pairs, ratios = match_self(descriptors, points, _setting('RATIO', RATIO), MIN_DISTANCE * side)
+    result['matches'] = len(pairs)
+
+    # Orient every pair left-to-right so a region and its copy always share a shift sign
+    src, dst = points[pairs[:, 0]], points[pairs[:, 1]]
+    swap = (src[:, 0] > dst[:, 0])[:, None]
+    src, dst = np.where(swap, dst, src), np.where(swap, src, dst)
+
+    # Glyphs match glyphs all over a document: drop text-to-text pairs
+    text = find_text_regions(image)
+    keep = ~(in_boxes(src, text) & in_boxes(dst, text))
+    src, dst, ratios = src[keep], dst[keep], ratios[keep]
+    if len(src) < _setting('MIN_CLUSTER', MIN_CLUSTER):
+        return result
+
+    labels = cluster_pairs(src, dst, CLUSTER_RADIUS * side)
+    clusters = []
+    for label in np.unique(labels):
+        members = labels == label
+        count = int(members.sum())
+        if count < _setting('MIN_CLUSTER', MIN_CLUSTER):
+            continue
+        source, target = _box(src[members]), _box(dst[members])
+        shift = np.median(dst[members] - src[members], axis=0)
+        if min(source[2:]) < MIN_REGION_SIDE * side or np.linalg.norm(shift) < MIN_SHIFT * side:
+            continue
+        clusters.append((shift, {
+            'source': _box(src[members] / scale),
+            'target': _box(dst[members] / scale),
+            'matches': count,
+            'score': round(float(count * np.mean(1 - ratios[members])), 3),
+        }))
+
+    repeating = periodic([shift for shift, _ in clusters], CLUSTER_RADIUS * side / 2)
+    regions = [region for (_, region), drop in zip(clusters, repeating) if not drop]
+    regions.sort(key=lambda r: r['score'], reverse=True)
+    result['regions'] = regions[:MAX_REGIONS]
+    result['has_copy_move'] = bool(regions)
+    return result
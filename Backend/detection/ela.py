@@ -0,0 +1,62 @@
+import numpy as np
+import cv2
+from django.conf import settings
+
+from detection import localization
+
+DEFAULT_QUALITIES = (75, 85, 90, 95)
+PRIMARY_QUALITY = 90
+THRESHOLD = 10
+LOCAL_MIN_DELTA = 2.0  # error levels above the median a block needs before it is flagged
+
+
+def recompress(bgr, quality):
+    ok, buf = cv2.imencode('.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError(f"JPEG re-encode failed at quality {quality}.")
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def error_levels(bgr, qualities, keep=None):
+    """Recompress ``bgr`` at every quality in memory and return per-quality stats.
+
+    One difference buffer is reused across qualities, so memory stays at two
+    extra copies of the image regardless of how many qualities are requested.
+    Returns ``(stats, error_map)``; the map is the luminance of the difference
+    at quality ``keep`` (None when ``keep`` is not given).
+    """
+    diff = np.empty_like(bgr)
+    flat = diff.reshape(diff.shape[0], -1)
+    stats = {}
+    error_map = None
+    for quality in qualities:
+        cv2.absdiff(bgr, recompress(bgr, quality), dst=diff)
+        mean, std = cv2.meanStdDev(flat)
+        stats[quality] = {
+            'difference_mean': float(mean[0][0]),
+            'difference_std': float(std[0][0]),
+            'difference_max': int(cv2.minMaxLoc(flat)[1]),
+        }
+        if quality == keep:
+            error_map = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+    return stats, error_map
+
+
+def error_level_analysis(bgr, qualities=None, primary=None, localize=False, scale=1.0):
+    qualities = list(qualities or getattr(settings, 'DETECTION_ELA_QUALITIES', DEFAULT_QUALITIES))
+    primary = primary or getattr(settings, 'DETECTION_ELA_PRIMARY_QUALITY', PRIMARY_QUALITY)
+    if primary not in qualities:
+        qualities.append(primary)
+
+    stats, error_map = error_levels(bgr, sorted(set(qualities)), keep=primary if localize else None)
+    diff_mean = stats[primary]['difference_mean']
+    result = {
+        'tamper_indication': diff_mean > THRESHOLD,
+        'difference_mean': diff_mean,
+        'threshold': THRESHOLD,
+        'quality': primary,
+        'qualities': {str(q): s for q, s in stats.items()},
+    }
+    if localize:
+        result['localization'] = localization.localize(error_map, scale, min_delta=LOCAL_MIN_DELTA)
+    return result
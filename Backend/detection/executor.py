@@ -0,0 +1,132 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent import futures
+from functools import partial
+
+from django.conf import settings
+
+DEFAULT_TIMEOUT = 30  # seconds
+
+_pools = {}
+_pools_lock = threading.Lock()
+_process_pool = None
+_process_slots = None
+
+
+def _shared_pool(name, workers):
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = _pools[name] = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+    return pool
+
+
+def get_pool():
+    workers = getattr(settings, 'DETECTION_CHECK_WORKERS', None) or min(16, (os.cpu_count() or 1) * 2)
+    return _shared_pool('detection-check', workers)
+
+
+def document_workers():
+    return getattr(settings, 'DETECTION_BATCH_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_document_pool():
+    # Separate from the check pool: documents fan their checks out to get_pool(),
+    # so sharing one pool could leave every thread waiting on its own checks.
+    return _shared_pool('detection-document', document_workers())
+
+
+def run_checks(checks, timeouts=None):
+    """Run independent checks on the shared pool and collect their results.
+
+    ``checks`` maps a result name to ``(callable, fallback)``. A check that
+    misses its time budget (counted from submission) is reported as its
+    fallback dict marked ``degraded`` instead of failing the whole request;
+    the thread keeps running in the background since it cannot be interrupted.
+    """
+    budgets = dict(getattr(settings, 'DETECTION_CHECK_TIMEOUTS', {}))
+    budgets.update(timeouts or {})
+    default = getattr(settings, 'DETECTION_CHECK_TIMEOUT', DEFAULT_TIMEOUT)
+
+    pool = get_pool()
+    started = time.monotonic()
+    pending = {name: pool.submit(fn) for name, (fn, _) in checks.items()}
+
+    results = {}
+    for name, future in pending.items():
+        budget = budgets.get(name, default)
+        try:
+            results[name] = future.result(timeout=max(0, started + budget - time.monotonic()))
+        except futures.TimeoutError:
+            future.cancel()
+            results[name] = dict(checks[name][1], degraded=True, error=f"Timed out after {budget}s")
+        except Exception as e:
+            results[name] = dict(checks[name][1], degraded=True, error=str(e))
+    return results
+
+
+def process_workers():
+    return getattr(settings, 'DETECTION_ASYNC_PROCESSES', None) or os.cpu_count() or 1
+
+
+def init_worker_process():
+    """Pool initializer: set up Django in the fresh process and warm the forensic stack."""
+    import django
+    django.setup()
+
+    from detection.warmup import warm_up
+    warm_up(force=True)
+
+
+def _analyze_in_process(source, content_type, name, password='', pages=None, mode=None):
+    from detection.ingest import map_file
+    from detection.views import UploadView
+
+    if isinstance(source, str):
+        # A spooled upload: map the file here rather than pickling its bytes across
+        with map_file(source) as data:
+            return UploadView().analyze_bytes(data, content_type, name, password, pages, mode=mode)
+    return UploadView().analyze_bytes(source, content_type, name, password, pages, mode=mode)
+
+
+def get_process_pool():
+    """Process pool for the async views; each worker imports OpenCV and loads the model once."""
+    global _process_pool
+    with _pools_lock:
+        if _process_pool is None:
+            _process_pool = futures.ProcessPoolExecutor(
+                max_workers=process_workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker_process,
+            )
+        return _process_pool
+
+
+async def analyze_in_process(source, content_type, name, password='', pages=None, mode=None):
+    """Run UploadView.analyze_bytes in the process pool without blocking the event loop.
+
+    ``source`` is the upload's bytes or the path of the file Django spooled it
+    to. At most DETECTION_ASYNC_QUEUE documents are handed to the pool at once;
+    further requests wait here, holding only their connection.
+    """
+    global _process_pool, _process_slots
+    if _process_slots is None:
+        _process_slots = asyncio.Semaphore(getattr(settings, 'DETECTION_ASYNC_QUEUE', None) or 2 * process_workers())
+
+    async with _process_slots:
+        pool = get_process_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                pool, partial(_analyze_in_process, source, content_type, name, password, pages, mode)
+            )
+        except futures.BrokenExecutor:
+            # A worker died (e.g. OOM-killed); start a fresh pool for the next request
+            with _pools_lock:
+                if _process_pool is pool:
+                    _process_pool = None
+            raise
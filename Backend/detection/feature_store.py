@@ -0,0 +1,57 @@
+from detection.lazy import LazyModule
+
+np = LazyModule('numpy')  # models imports this module during django.setup()
+
+# Order of the classifier's input columns; stored rows follow it too
+FEATURE_NAMES = ('has_exif', 'ela_difference_mean', 'keypoints', 'noise_std', 'inconsistent_edges')
+INPUT_CHECKS = ('exif_metadata', 'error_level_analysis', 'noise_analysis', 'edge_analysis')
+# The keypoint feature comes from copy-move detection, or from keypoint_count when tier 2 did not run
+KEYPOINT_CHECKS = ('copy_move_detection', 'keypoint_count')
+DTYPE = '<f4'  # 20 bytes per record
+TAMPERED_LABEL = 2
+OVERRIDE_PROBABILITY = 0.8  # model confidence that overrides the rule-based score
+VERDICT_THRESHOLD = 60
+
+
+def has_inputs(checks):
+    """Whether every check the feature vector reads from ran (results from before keypoint_count lack one)."""
+    return all(name in checks for name in INPUT_CHECKS) and any(name in checks for name in KEYPOINT_CHECKS)
+
+
+def _keypoints(checks):
+    counts = next(checks[name] for name in KEYPOINT_CHECKS if name in checks)
+    # Estimated native-resolution count the model was trained on; older results only have the capped one
+    return counts.get('model_keypoints', counts.get('keypoints', 0))
+
+
+def from_checks(checks):
+    """Build the classifier's feature vector from a results['checks'] dict."""
+    return [
+        1 if checks['exif_metadata'].get('exists') else 0,
+        checks['error_level_analysis'].get('difference_mean', 0),
+        _keypoints(checks),
+        checks['noise_analysis'].get('std_dev', 0),
+        1 if checks['edge_analysis'].get('inconsistent_edges') else 0,
+    ]
+
+
+def encode(features):
+    return np.asarray(features, dtype=DTYPE).tobytes()
+
+
+def decode(blobs):
+    """Stack stored feature blobs into an (n, len(FEATURE_NAMES)) float32 matrix."""
+    if not blobs:
+        return np.empty((0, len(FEATURE_NAMES)), DTYPE)
+    return np.frombuffer(b''.join(blobs), dtype=DTYPE).reshape(len(blobs), len(FEATURE_NAMES))
+
+
+def verdicts(base_confidence, labels, probabilities):
+    """Vectorized twin of the end of detect_tampering: apply the model override and the threshold.
+
+    Returns (confidence, is_authentic) arrays.
+    """
+    override = (labels == TAMPERED_LABEL) & (probabilities > OVERRIDE_PROBABILITY)
+    confidence = np.where(override, np.minimum(base_confidence, np.round(probabilities * 100, 2)), base_confidence)
+    confidence = np.round(np.clip(confidence, 0, 100), 2)
+    return confidence, confidence >= VERDICT_THRESHOLD
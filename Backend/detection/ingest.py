@@ -0,0 +1,169 @@
+import contextlib
+import io
+import mmap
+import subprocess
+
+from django.conf import settings
+
+from detection.lazy import LazyModule
+
+PyPDF2 = LazyModule('PyPDF2')
+
+PDF_DPI = 200
+PDF_MAX_PAGES = 10
+PDFTOPPM = 'pdftoppm'
+
+
+class UploadError(Exception):
+    """An upload that cannot be analyzed; reported to the client as a 400."""
+
+
+@contextlib.contextmanager
+def map_file(path):
+    """Yield a read-only memory map of the file at ``path``."""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield buffer
+    finally:
+        try:
+            buffer.close()
+        except BufferError:
+            pass  # an array still views the mapping; it is unmapped when that is collected
+
+
+class BufferReader(io.RawIOBase):
+    """A seekable read-only file over a buffer (bytes or a memory map).
+
+    Unlike io.BytesIO, which copies an mmap onto the heap first, it reads
+    through a memoryview: only the slices asked for are copied.
+    """
+
+    def __init__(self, data):
+        super().__init__()
+        self._view = memoryview(data).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        if base + offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = base + offset
+        return self._pos
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        chunk = bytes(self._view[self._pos:end]) if end > self._pos else b''
+        self._pos = max(self._pos, end)
+        return chunk
+
+    readall = read
+
+    def readinto(self, buffer):
+        target = memoryview(buffer).cast('B')
+        size = max(0, min(len(target), len(self._view) - self._pos))
+        target[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._view.release()  # lets map_file unmap the file
+        super().close()
+
+
+@contextlib.contextmanager
+def upload_buffer(uploaded_file):
+    """Yield the bytes of an upload without writing another copy to disk.
+
+    Uploads up to FILE_UPLOAD_MAX_MEMORY_SIZE are already held in memory by
+    Django. Larger ones were spooled to a temporary file by the upload handler,
+    which is memory-mapped read-only here instead of being read into RAM.
+    """
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        with map_file(uploaded_file.temporary_file_path()) as buffer:
+            yield buffer
+    else:
+        uploaded_file.seek(0)
+        yield uploaded_file.read()
+
+
+def open_pdf(data, password=''):
+    """Parse the PDF in memory and unlock it; no page is rendered here."""
+    reader = PyPDF2.PdfReader(BufferReader(data))
+    if reader.is_encrypted:
+        if not password:
+            raise UploadError("PDF is password protected.")
+        if not reader.decrypt(password):
+            raise UploadError("Incorrect PDF password.")
+    return reader
+
+
+def decrypt_pdf(data, password='', reader=None):
+    """The PDF's bytes with encryption removed; ``reader`` is ``data`` already opened by open_pdf."""
+    reader = reader or open_pdf(data, password)
+    if not reader.is_encrypted:
+        return data
+    writer = PyPDF2.PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    decrypted = io.BytesIO()
+    writer.write(decrypted)
+    return decrypted.getvalue()
+
+
+def select_pages(pages, page_count):
+    """Turn a ``pages`` request value ('first', 'all' or '1,3') into 1-based page numbers."""
+    max_pages = getattr(settings, 'DETECTION_PDF_MAX_PAGES', PDF_MAX_PAGES)
+    pages = str(pages or 'first').strip().lower()
+    if pages == 'first':
+        selected = [1]
+    elif pages == 'all':
+        selected = list(range(1, page_count + 1))
+    else:
+        try:
+            selected = sorted({int(p) for p in pages.split(',') if p.strip()})
+        except ValueError:
+            raise UploadError("pages must be 'first', 'all' or a comma-separated list of page numbers.")
+        if not selected or selected[0] < 1 or selected[-1] > page_count:
+            raise UploadError(f"pages must be between 1 and {page_count}.")
+
+    if not selected or page_count < 1:
+        raise UploadError("PDF has no pages.")
+    if len(selected) > max_pages:
+        raise UploadError(f"At most {max_pages} pages can be analyzed per document.")
+    return selected
+
+
+def render_page(data, page, dpi=None):
+    """Render a single page of an unencrypted PDF to JPEG bytes at the analysis DPI.
+
+    The PDF is piped to pdftoppm on stdin and the JPEG read back from stdout,
+    so no input or output file touches the disk. Encrypted documents go
+    through decrypt_pdf first: a password on the command line would be
+    visible to every user on the host.
+    """
+    dpi = dpi or getattr(settings, 'DETECTION_PDF_DPI', PDF_DPI)
+    command = [
+        getattr(settings, 'DETECTION_PDFTOPPM', PDFTOPPM),
+        '-f', str(page), '-l', str(page), '-r', str(dpi),
+        '-jpeg', '-jpegopt', 'quality=75', '-singlefile',
+        '-',  # read the PDF from stdin; with no output root the image goes to stdout
+    ]
+
+    try:
+        rendered = subprocess.run(command, input=data, capture_output=True)
+    except FileNotFoundError:
+        raise RuntimeError("pdftoppm not found. Is poppler installed and in PATH?")
+    if rendered.returncode != 0 or not rendered.stdout:
+        raise UploadError("Could not convert PDF to image.")
+    return rendered.stdout
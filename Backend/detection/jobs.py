@@ -0,0 +1,147 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from detection.lazy import LazyModule
+from detection.models import AnalysisJob, UploadHistory
+
+phash = LazyModule('detection.phash')
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(user, file_name, content_type, data):
+    job = AnalysisJob(
+        user=user,
+        file_name=file_name,
+        content_type=content_type,
+        max_attempts=_setting('DETECTION_JOB_MAX_ATTEMPTS', 3),
+    )
+    job.upload.save(file_name, ContentFile(data), save=False)
+    job.save()
+    return job
+
+
+def claim_next():
+    """Atomically move the oldest runnable job to RUNNING and return it.
+
+    Jobs whose lease expired (their worker died mid-run) are runnable again.
+    The conditional UPDATE guarantees only one worker wins each job.
+    """
+    now = timezone.now()
+    runnable = (
+        Q(status=AnalysisJob.QUEUED, available_at__lte=now)
+        | Q(status=AnalysisJob.RUNNING, locked_until__lt=now)
+    )
+    lease = timedelta(seconds=_setting('DETECTION_JOB_LEASE', 300))
+    candidates = AnalysisJob.objects.filter(runnable).order_by('available_at').values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        claimed = AnalysisJob.objects.filter(runnable, pk=pk).update(
+            status=AnalysisJob.RUNNING,
+            locked_until=now + lease,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return AnalysisJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    from detection.views import UploadError, UploadView
+
+    now = timezone.now()
+    if job.attempts > job.max_attempts:
+        _finish(job, AnalysisJob.FAILED, error=job.error or "Worker lost the job too many times.")
+        return
+
+    try:
+        results = UploadView().analyze_file(job.upload.path, job.content_type)
+    except UploadError as e:
+        _finish(job, AnalysisJob.FAILED, error=str(e))
+        return
+    except Exception as e:
+        logger.exception("Analysis job %s failed (attempt %s)", job.pk, job.attempts)
+        _retry(job, str(e), now)
+        return
+
+    if results.get('error'):
+        # detect_tampering reports a pipeline failure as is_authentic=False; that is not a verdict
+        logger.error("Analysis job %s failed (attempt %s): %s", job.pk, job.attempts, results['error'])
+        _retry(job, results['error'], now)
+        return
+
+    similar = phash.similar(results, job.user_id)
+    if job.user_id:
+        job.history = UploadHistory.from_results(job.user, job.upload.name, results)
+        job.history.save()
+        phash.index([job.history])
+    _finish(job, AnalysisJob.DONE, result=dict(results, similar_uploads=similar))
+
+
+def _retry(job, error, now):
+    """Queue the job again after an exponential backoff, or fail it once its attempts are used up."""
+    if job.attempts < job.max_attempts:
+        delay = _setting('DETECTION_JOB_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+        job.status = AnalysisJob.QUEUED
+        job.available_at = now + timedelta(seconds=delay)
+        job.locked_until = None
+        job.error = error
+        job.save(update_fields=['status', 'available_at', 'locked_until', 'error'])
+    else:
+        _finish(job, AnalysisJob.FAILED, error=error)
+
+
+def _finish(job, status, result=None, error=''):
+    now = timezone.now()
+    job.status = status
+    job.result = result
+    job.error = error
+    job.locked_until = None
+    job.finished_at = now
+    job.expires_at = now + timedelta(seconds=_setting('DETECTION_JOB_RESULT_TTL', 86400))
+    job.save(update_fields=['status', 'result', 'error', 'locked_until', 'finished_at', 'expires_at', 'history'])
+
+
+def purge_expired():
+    expired = AnalysisJob.objects.filter(
+        status__in=[AnalysisJob.DONE, AnalysisJob.FAILED],
+        expires_at__lt=timezone.now(),
+    )
+    count = 0
+    for job in expired.iterator():
+        if job.history_id is None and job.upload:
+            job.upload.delete(save=False)
+            job.upload = ''
+        job.status = AnalysisJob.EXPIRED
+        job.result = None
+        job.save(update_fields=['status', 'result', 'upload'])
+        count += 1
+    return count
+
+
+def work(poll_interval=1.0, burst=False, purge_interval=60):
+    """Process jobs until interrupted; with ``burst``, stop once the queue is empty."""
+    next_purge = 0.0
+    while True:
+        close_old_connections()
+        if time.monotonic() >= next_purge:
+            purge_expired()
+            next_purge = time.monotonic() + purge_interval
+
+        job = claim_next()
+        if job is not None:
+            run_job(job)
+            continue
+        if burst:
+            return
+        time.sleep(poll_interval)
@@ -0,0 +1,301 @@
+import hashlib
+
+import numpy as np
+from django.conf import settings
+
+from detection.localization import blocks
+
+# Natural (row-major) index of each coefficient in the zigzag order DQT segments store them in
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+])
+# ITU T.81 Annex K tables, which libjpeg (and so PIL, OpenCV, GIMP, ImageMagick) scales by quality
+STANDARD_LUMINANCE = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+])
+STANDARD_CHROMINANCE = np.array([
+    17, 18, 24, 47, 99, 99, 99, 99,
+    18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,
+    47, 66, 99, 99, 99, 99, 99, 99,
+] + [99] * 32)
+
+EXIF_ORIENTATION = 0x0112
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+PROGRESSIVE_MARKERS = {0xC2, 0xC6, 0xCA, 0xCE}
+
+MAX_BLOCKS = 1 << 17  # 8x8 blocks histogrammed (every block up to ~8 MP, an even spread beyond)
+DQ_POSITIONS = ZIGZAG[1:11]  # low-frequency AC coefficients: enough non-zero values to histogram
+DQ_BINS = 24  # |quantized coefficient| values histogrammed per position
+DQ_MIN_STEP = 2  # smaller steps drown in the decoder's rounding noise
+DQ_MIN_POSITIONS = 3  # positions with gaps a first-quality hypothesis needs to be judged
+DQ_MIN_EXPECTED = 50  # ... and coefficients expected in those gaps
+DQ_THRESHOLD = 0.7  # share of the expected coefficients missing from the gaps
+
+
+def _ijg_tables(base):
+    """libjpeg's scaling of ``base`` for every quality 1-100, as a (100, 64) array."""
+    quality = np.arange(1, 101)
+    scale = np.where(quality < 50, 5000 // quality, 200 - 2 * quality)
+    return np.clip((base[None, :] * scale[:, None] + 50) // 100, 1, 255)
+
+
+IJG_LUMINANCE = _ijg_tables(STANDARD_LUMINANCE)
+IJG_CHROMINANCE = _ijg_tables(STANDARD_CHROMINANCE)
+
+
+def _dct_matrix():
+    k = np.arange(8)
+    matrix = np.cos((2 * k[None, :] + 1) * k[:, None] * np.pi / 16) * 0.5
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+DCT = _dct_matrix()
+# Row-major 8x8 block -> coefficient at each DQ position
+DQ_BASIS = np.einsum('ui,vj->uvij', DCT, DCT).reshape(64, 64)[DQ_POSITIONS].T.copy()
+
+
+def is_jpeg(data):
+    return data[:3] == b'\xff\xd8\xff'
+
+
+def read_header(data):
+    """Parse the marker segments up to the first scan; no entropy-coded data is touched.
+
+    Returns {'tables': {id: (8, 8) int array}, 'components': [(id, h, v, table_id)],
+    'width', 'height', 'progressive'}. Raises ValueError for a malformed stream.
+    """
+    if not is_jpeg(data):
+        raise ValueError("Not a JPEG file.")
+    header = {'tables': {}, 'components': [], 'width': None, 'height': None, 'progressive': False}
+    pos, end = 2, len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            raise ValueError(f"Corrupt JPEG: expected a marker at offset {pos}.")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # no length field
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # end of image / start of scan
+            break
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if length < 2 or pos + 2 + length > end:
+            raise ValueError("Corrupt JPEG: truncated segment.")
+        segment = bytes(data[pos + 4:pos + 2 + length])
+        if marker == 0xDB:
+            _read_dqt(segment, header['tables'])
+        elif marker in SOF_MARKERS:
+            _read_sof(segment, header)
+            header['progressive'] = marker in PROGRESSIVE_MARKERS
+        pos += 2 + length
+    if not header['tables'] or not header['components']:
+        raise ValueError("Corrupt JPEG: no quantization tables or frame header.")
+    return header
+
+
+def _read_dqt(segment, tables):
+    offset = 0
+    while offset < len(segment):
+        precision, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+        dtype = np.dtype('>u2') if precision else np.dtype('u1')
+        if offset + 1 + 64 * dtype.itemsize > len(segment):
+            raise ValueError("Corrupt JPEG: truncated quantization table.")
+        values = np.frombuffer(segment, dtype=dtype, count=64, offset=offset + 1)
+        table = np.empty(64, np.int32)
+        table[ZIGZAG] = values
+        tables[table_id] = table.reshape(8, 8)
+        offset += 1 + 64 * dtype.itemsize
+
+
+def _read_sof(segment, header):
+    if len(segment) < 6 or len(segment) < 6 + 3 * segment[5]:
+        raise ValueError("Corrupt JPEG: truncated frame header.")
+    header['height'] = int.from_bytes(segment[1:3], 'big')
+    header['width'] = int.from_bytes(segment[3:5], 'big')
+    header['components'] = [
+        (segment[i], segment[i + 1] >> 4, segment[i + 1] & 0x0F, segment[i + 2])
+        for i in range(6, 6 + 3 * segment[5], 3)
+    ]
+
+
+def subsampling(components):
+    if len(components) == 1:
+        return 'grayscale'
+    (_, h, v, _), others = components[0], components[1:]
+    if any((oh, ov) != (1, 1) for _, oh, ov, _ in others):
+        return 'other'
+    return {(1, 1): '4:4:4', (2, 1): '4:2:2', (2, 2): '4:2:0', (4, 1): '4:1:1'}.get((h, v), f'{h}x{v}')
+
+
+def estimate_quality(luminance, chrominance=None):
+    """Closest libjpeg quality for the tables, and whether they are exactly libjpeg's.
+
+    Camera firmware and some editors use their own tables; for those the
+    quality is only the nearest libjpeg equivalent.
+    """
+    error = np.abs(IJG_LUMINANCE - luminance.ravel()).sum(axis=1)
+    if chrominance is not None:
+        error = error + np.abs(IJG_CHROMINANCE - chrominance.ravel()).sum(axis=1)
+    best = int(np.argmin(error))
+    return best + 1, bool(error[best] == 0)
+
+
+def table_hash(tables):
+    digest = hashlib.sha1()
+    for table_id in sorted(tables):
+        digest.update(tables[table_id].astype('<u2').tobytes())
+    return digest.hexdigest()[:16]
+
+
+def match_signature(luminance, chrominance, standard):
+    """Name and kind of the encoder whose tables these are, from DETECTION_QTABLE_SIGNATURES.
+
+    Each signature is {'name', 'kind' ('camera' or 'editor'), 'luminance'
+    and optionally 'chrominance'}, tables as 64 values in row-major order.
+    """
+    for signature in getattr(settings, 'DETECTION_QTABLE_SIGNATURES', ()):
+        if not np.array_equal(np.ravel(signature['luminance']), luminance.ravel()):
+            continue
+        if signature.get('chrominance') is not None and (
+                chrominance is None or not np.array_equal(np.ravel(signature['chrominance']), chrominance.ravel())):
+            continue
+        return signature['name'], signature.get('kind', 'camera')
+    if standard:
+        return 'libjpeg', 'encoder'
+    return None, None
+
+
+def dct_coefficients(luma, max_blocks=MAX_BLOCKS, band=64):
+    """The DQ_POSITIONS DCT coefficients of up to ``max_blocks`` 8x8 blocks, as (blocks, positions).
+
+    Only the needed basis functions are projected, a band of block rows at a
+    time, so memory stays flat on large scans.
+    """
+    tiles = blocks(luma, 8)
+    if not tiles.shape[0] or not tiles.shape[1]:
+        return np.empty((0, len(DQ_POSITIONS)), np.float32)
+    stride = int(np.ceil(np.sqrt(tiles.shape[0] * tiles.shape[1] / max_blocks)))
+    if stride > 1:
+        tiles = tiles[::stride, ::stride]
+    # AC basis functions sum to zero, so JPEG's level shift by 128 is not needed
+    return np.concatenate([
+        tiles[row:row + band].reshape(-1, 64).astype(np.float32) @ DQ_BASIS
+        for row in range(0, tiles.shape[0], band)
+    ])
+
+
+def _gap_masses(histogram, candidates, step):
+    """Coefficients found in, and expected in, the bins that re-quantizing each candidate
+    first step q1 (> ``step``) with ``step`` leaves empty; two arrays, one value per candidate.
+    """
+    bins = np.arange(DQ_BINS + 1)
+    # Every multiple of q1 below the last bin, as a multiple of step; a value exactly between
+    # two bins may land in either once decoding noise is added
+    ratios = bins[1:, None] * candidates[None, :] / step
+    reachable = np.zeros((len(candidates), DQ_BINS + 2), bool)
+    columns = np.arange(len(candidates))[None, :]
+    for rounded in (np.floor(ratios + 0.5), np.ceil(ratios - 0.5)):
+        reachable[columns, np.minimum(rounded, DQ_BINS + 1).astype(np.intp)] = True
+    reachable = reachable[:, :-1]
+
+    # Nearest reachable bin on each side, for filling the gaps in on a log scale
+    # (counts fall off roughly exponentially)
+    before = np.maximum.accumulate(np.where(reachable, bins, -1), axis=1)
+    after = np.minimum.accumulate(np.where(reachable, bins, DQ_BINS + 1)[:, ::-1], axis=1)[:, ::-1]
+    gaps = ~reachable & (before >= 1) & (after <= DQ_BINS)
+    before, after = np.clip(before, 0, DQ_BINS), np.clip(after, 0, DQ_BINS)
+    log_histogram = np.log1p(histogram)
+    span = np.maximum(after - before, 1)
+    filled = log_histogram[before] + (log_histogram[after] - log_histogram[before]) * (bins - before) / span
+    return (histogram * gaps).sum(axis=1), (np.expm1(filled) * gaps).sum(axis=1)
+
+
+def double_quantization(coefficients, table):
+    """Look for an earlier, coarser libjpeg compression under the current one.
+
+    Re-quantizing coefficients that were multiples of q1 with a finer step
+    q2 can only produce the values round(k * q1 / q2); the others stay
+    (almost) empty, a comb of gaps no single compression leaves. Each first
+    quality 1-100 predicts q1 at every low-frequency position, and is scored
+    by the share of the coefficients a smooth histogram would put in its
+    gaps that are missing, pooled over the positions. Returns (score,
+    quality) for the best one, or None when no hypothesis had enough
+    coefficients to judge (e.g. at quality 95+, where q2 is 1).
+
+    A first compression at a higher quality than the second leaves no gaps
+    and is not detected; neither, reliably, is one with non-libjpeg tables.
+    """
+    steps = table.ravel()[DQ_POSITIONS]
+    positions, width = len(DQ_POSITIONS), DQ_BINS + 2  # the last bin collects everything beyond DQ_BINS
+    quantized = np.abs(coefficients / steps.astype(np.float32))
+    np.rint(quantized, out=quantized)
+    np.minimum(quantized, DQ_BINS + 1, out=quantized)
+    # One bincount for all positions: position i's histogram lives at [i * width, (i + 1) * width)
+    flat = (quantized.astype(np.intp) + np.arange(positions) * width).ravel()
+    histograms = np.bincount(flat, minlength=positions * width).reshape(positions, width)[:, :-1].astype(np.float64)
+
+    observed = np.zeros((positions, 100))
+    expected = np.zeros((positions, 100))
+    for i, (step, histogram) in enumerate(zip(steps, histograms)):
+        if step < DQ_MIN_STEP:
+            continue
+        candidates = IJG_LUMINANCE[:, DQ_POSITIONS[i]]
+        coarser = candidates > step
+        observed[i, coarser], expected[i, coarser] = _gap_masses(histogram, candidates[coarser], step)
+
+    total = expected.sum(axis=0)
+    usable = ((expected > 0).sum(axis=0) >= DQ_MIN_POSITIONS) & (total >= DQ_MIN_EXPECTED)
+    if not usable.any():
+        return None
+    scores = np.where(usable, 1 - observed.sum(axis=0) / np.maximum(total, 1e-9), -np.inf)
+    best = int(np.argmax(scores))
+    return float(scores[best]), best + 1
+
+
+def analyze(data, luma=None):
+    """Compression forensics for a JPEG: header-derived quality and signature, and,
+    given its decoded luminance plane, double quantization.
+    """
+    header = read_header(data)
+    components = header['components']
+    luminance = header['tables'].get(components[0][3])
+    if luminance is None:
+        raise ValueError("Corrupt JPEG: frame refers to a missing quantization table.")
+    chrominance = header['tables'].get(components[1][3]) if len(components) > 1 else None
+
+    quality, standard = estimate_quality(luminance, chrominance)
+    signature, kind = match_signature(luminance, chrominance, standard)
+    result = {
+        'format': 'JPEG',
+        'quality': quality,
+        'standard_tables': standard,
+        'signature': signature,
+        'signature_kind': kind,
+        'table_hash': table_hash(header['tables']),
+        'subsampling': subsampling(components),
+        'progressive': header['progressive'],
+        'double_quantization': None,
+    }
+    if luma is not None:
+        found = double_quantization(dct_coefficients(luma), luminance)
+        if found is not None:
+            score, primary = found
+            result['double_quantization'] = score >= DQ_THRESHOLD
+            result['dq_score'] = round(max(score, 0.0), 3)
+            if result['double_quantization']:
+                result['primary_quality'] = primary
+    return result
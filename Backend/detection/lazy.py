@@ -0,0 +1,26 @@
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that is only imported on first attribute access.
+
+    Lets the web layer name numpy, OpenCV, PyPDF2 and the check modules at
+    the top of a file without paying for them when a process merely loads
+    URLs or runs an unrelated management command. warmup.warm_up() imports
+    the real modules ahead of traffic.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Only called for names not in the proxy's own __dict__
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self.__name__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self.__name__!r}>"
@@ -0,0 +1,148 @@
+import base64
+
+import numpy as np
+import cv2
+from django.conf import settings
+from numpy.lib.stride_tricks import as_strided
+
+BLOCK_SIZES = (16, 32, 64, 128)  # multiples of the 8x8 JPEG grid
+MAX_GRID = 64  # blocks along the longer side; picks the block size when not configured
+Z_THRESHOLD = 3.5  # robust z-score a block must exceed to be flagged
+Z_MAX = 8.0  # z-score mapped to the top heatmap level
+LEVELS = 16  # heatmap quantization; two 4-bit cells per byte
+MIN_BLOCKS = 2  # flagged blocks needed to report a region
+SIGNIFICANT_BLOCKS = 4  # ... and to count as evidence when deciding whether to run the costly checks
+MAX_REGIONS = 10
+EDGE_LIMIT = 24  # gradient of the blurred image above which a pixel counts as edge, not noise
+
+
+def enabled():
+    return getattr(settings, 'DETECTION_LOCALIZATION', True)
+
+
+def block_size(shape):
+    block = getattr(settings, 'DETECTION_LOCALIZATION_BLOCK', None)
+    if block:
+        return block
+    side = max(shape[:2])
+    return next((b for b in BLOCK_SIZES if side / b <= MAX_GRID), BLOCK_SIZES[-1])
+
+
+def blocks(image, block):
+    """View ``image`` as a (rows, cols, block, block) grid of tiles without copying.
+
+    Trailing pixels that do not fill a whole block are left out.
+    """
+    rows, cols = image.shape[0] // block, image.shape[1] // block
+    s0, s1 = image.strides[:2]
+    return as_strided(image, (rows, cols, block, block), (block * s0, block * s1, s0, s1), writeable=False)
+
+
+def block_means(image, block):
+    return blocks(image, block).mean(axis=(2, 3), dtype=np.float32)
+
+
+def masked_block_means(image, block, keep, min_kept=0.25):
+    """Block means over the pixels where ``keep`` (uint8, 255 = use) is set.
+
+    Blocks with fewer than ``min_kept`` usable pixels get NaN.
+    """
+    sums = block_means(cv2.bitwise_and(image, keep), block)
+    share = block_means(keep, block) / 255
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(share >= min_kept, sums / share, np.nan)
+
+
+def smooth_mask(blurred, limit=EDGE_LIMIT):
+    """255 where ``blurred`` has no strong edge nearby.
+
+    Blurring removes sensor noise but keeps text strokes and barcodes, so the
+    morphological gradient of the blurred image marks edges whatever the noise
+    level; their residue would otherwise read as local noise.
+    """
+    gradient = cv2.morphologyEx(blurred, cv2.MORPH_GRADIENT, np.ones((5, 5), np.uint8))
+    return cv2.compare(gradient, limit, cv2.CMP_LE)
+
+
+def robust_z(values):
+    """Z-scores against the median and MAD of the image's own blocks."""
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    spread = 1.4826 * mad if mad > 1e-6 else float(values.std()) or 1.0
+    return (values - median) / spread, float(median)
+
+
+def encode_heatmap(z):
+    """Quantize z-scores to LEVELS steps and pack two cells per byte, base64-encoded."""
+    levels = np.clip(z / Z_MAX * (LEVELS - 1), 0, LEVELS - 1).astype(np.uint8).ravel()
+    if levels.size % 2:
+        levels = np.append(levels, np.uint8(0))
+    packed = (levels[0::2] << 4) | levels[1::2]
+    return base64.b64encode(packed.tobytes()).decode()
+
+
+def find_regions(mask, z, block, scale):
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    if count <= 1:
+        return []
+    # Peak z-score per component, in one pass over the grid
+    peaks = np.zeros(count, np.float32)
+    np.maximum.at(peaks, labels.ravel(), z.ravel())
+
+    regions = []
+    for label in range(1, count):
+        x, y, w, h, area = stats[label]
+        if area < MIN_BLOCKS:
+            continue
+        regions.append({
+            'box': [int(round(v * block / scale)) for v in (x, y, w, h)],
+            'blocks': int(area),
+            'score': round(float(peaks[label]), 2),
+        })
+    regions.sort(key=lambda r: (r['score'], r['blocks']), reverse=True)
+    return regions[:MAX_REGIONS]
+
+
+def localize(stat_map, scale=1.0, min_delta=0.0, two_sided=False, keep=None):
+    """Summarize a per-pixel statistic (ELA error, noise residual) block by block.
+
+    Blocks whose mean is a robust outlier against the rest of the image, and
+    at least ``min_delta`` away from the median in absolute terms, are
+    flagged. ``two_sided`` also flags blocks that are unusually low (e.g. a
+    pasted region smoother than the rest of the card). Boxes are in native
+    pixels; ``scale`` is the working scale ``stat_map`` was computed at.
+    ``keep`` (see smooth_mask) restricts each block's mean to those pixels.
+    """
+    block = block_size(stat_map.shape)
+    if keep is not None:
+        means = masked_block_means(stat_map, block, keep)
+    else:
+        means = block_means(stat_map, block)
+    if min(means.shape) < 2:
+        return None
+
+    valid = ~np.isnan(means)
+    if not valid.any():
+        return None
+    means = np.where(valid, means, np.median(means[valid]))  # edge-only blocks count as typical
+
+    z, median = robust_z(means)
+    deviation = means - median
+    if two_sided:
+        z, deviation = np.abs(z), np.abs(deviation)
+    mask = (z > Z_THRESHOLD) & (deviation >= min_delta)
+
+    return {
+        'block': int(round(block / scale)),
+        'grid': list(means.shape),
+        'levels': LEVELS,
+        'heatmap': encode_heatmap(z),
+        'suspicious_ratio': round(float(mask.mean()), 4),
+        'regions': find_regions(mask, z, block, scale),
+    }
+
+
+def has_significant_region(result):
+    """Whether a check's localization block reports a region of SIGNIFICANT_BLOCKS or more."""
+    regions = (result.get('localization') or {}).get('regions') or []
+    return any(region['blocks'] >= SIGNIFICANT_BLOCKS for region in regions)
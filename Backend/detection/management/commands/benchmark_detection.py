@@ -0,0 +1,64 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from detection import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Time each UploadView check on a synthetic ID-document corpus and compare against a baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resolutions', default='small,medium,large',
+                            help=f"Comma-separated subset of {', '.join(benchmarks.RESOLUTIONS)}.")
+        parser.add_argument('--methods', default=','.join(benchmarks.METHODS),
+                            help="Comma-separated UploadView methods to time.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per method and sample.")
+        parser.add_argument('--mode', default='thorough', choices=('fast', 'standard', 'thorough'),
+                            help="Pipeline mode for detect_tampering and the PDF samples.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-pdf', action='store_true', help="Skip the PDF samples (needs poppler).")
+        parser.add_argument('--save', metavar='PATH', help="Write the results as a JSON baseline.")
+        parser.add_argument('--baseline', metavar='PATH', help="Fail if any p50 regressed against this baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p50 slowdown (0.2 = 20%%).")
+        parser.add_argument('--min-delta', type=float, default=benchmarks.MIN_DELTA_MS,
+                            help="Ignore p50 slowdowns smaller than this many ms.")
+
+    def handle(self, *args, **options):
+        resolutions = [r for r in options['resolutions'].split(',') if r]
+        unknown = set(resolutions) - set(benchmarks.RESOLUTIONS)
+        if unknown:
+            raise CommandError(f"Unknown resolutions: {', '.join(sorted(unknown))}")
+        methods = [m for m in options['methods'].split(',') if m]
+        unknown = set(methods) - set(benchmarks.METHODS)
+        if unknown:
+            raise CommandError(f"Unknown methods: {', '.join(sorted(unknown))}")
+
+        corpus = benchmarks.build_corpus(resolutions, seed=options['seed'], pdfs=not options['no_pdf'])
+        self.stdout.write(f"Corpus: {len(corpus)} samples, {options['repeat']} runs each")
+        results = benchmarks.run(corpus, methods, repeat=options['repeat'], mode=options['mode'])
+
+        self.stdout.write(f"{'method':<26}{'sample':<26}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+        for key, stats in results.items():
+            method, sample = key.split('|', 1)
+            if 'error' in stats:
+                self.stdout.write(f"{method:<26}{sample:<26}  error: {stats['error']}")
+                continue
+            self.stdout.write(
+                f"{method:<26}{sample:<26}{stats['p50_ms']:>10.1f}{stats['p90_ms']:>10.1f}"
+                f"{stats['p99_ms']:>10.1f}{stats['peak_mb']:>10.1f}"
+            )
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({'environment': benchmarks.environment(), 'results': results}, f, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['results']
+            regressions = benchmarks.compare(results, baseline, options['tolerance'], options['min_delta'])
+            if regressions:
+                lines = [f"  {key}: {before:.1f} ms -> {after:.1f} ms (x{ratio})" for key, before, after, ratio in regressions]
+                raise CommandError("Performance regressions against baseline:\n" + "\n".join(lines))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
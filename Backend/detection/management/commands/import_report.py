@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported; phase timings go to stdout
+CHILD = """
+import importlib, json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+phases = {'django.setup': time.perf_counter() - started}
+mark = time.perf_counter()
+importlib.import_module(sys.argv[1])
+phases['import ' + sys.argv[1]] = time.perf_counter() - mark
+if sys.argv[2] == 'warm':
+    from detection.warmup import warm_up
+    mark = time.perf_counter()
+    warm_up(force=True)
+    phases['warm_up'] = time.perf_counter() - mark
+print(json.dumps(phases))
+"""
+
+
+def parse_importtime(output):
+    """(name, self_us, cumulative_us, depth) per line of ``python -X importtime`` output."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Measure what a cold process spends importing the app, module by module."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', default=settings.ROOT_URLCONF,
+                            help="Module imported after django.setup() (default: ROOT_URLCONF).")
+        parser.add_argument('--warm', action='store_true', help="Also run detection.warmup.warm_up().")
+        parser.add_argument('--limit', type=int, default=25, help="Rows to show.")
+        parser.add_argument('--by-package', action='store_true',
+                            help="Sum self time per top-level package instead of listing modules.")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD, options['target'], 'warm' if options['warm'] else ''],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if process.returncode:
+            raise CommandError(f"Import failed:\n{process.stderr[-2000:]}")
+
+        phases = json.loads(process.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(process.stderr)
+        total = sum(cumulative for _, _, cumulative, depth in modules if depth == 0)
+
+        self.stdout.write(f"Imported {len(modules)} modules in {total / 1000:.1f} ms")
+        for phase, seconds in phases.items():
+            self.stdout.write(f"  {phase:<40}{seconds * 1000:>10.1f} ms")
+        self.stdout.write('')
+
+        if options['by_package']:
+            packages = {}
+            for name, own, _, _ in modules:
+                package = name.split('.')[0]
+                packages[package] = packages.get(package, 0) + own
+            self.stdout.write(f"{'package':<40}{'self ms':>10}")
+            for package, own in sorted(packages.items(), key=lambda p: -p[1])[:options['limit']]:
+                self.stdout.write(f"{package:<40}{own / 1000:>10.1f}")
+            return
+
+        self.stdout.write(f"{'module':<50}{'self ms':>10}{'cumulative ms':>15}")
+        for name, own, cumulative, _ in sorted(modules, key=lambda m: -m[2])[:options['limit']]:
+            self.stdout.write(f"{name:<50}{own / 1000:>10.1f}{cumulative / 1000:>15.1f}")
@@ -0,0 +1,142 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from detection import feature_store
+from detection.models import UploadHistory
+from detection.registry import model_registry
+
+RESULTS = ('Original', 'Tampered')
+UPDATE_CHUNK = 900  # ids per IN (...) clause, under SQLite's bound-parameter limit
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = "Re-score stored upload features with the current classifier, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20000,
+                            help="Records loaded and scored per predict_proba call.")
+        parser.add_argument('--all', action='store_true',
+                            help="Also re-score records already scored by the current model.")
+        parser.add_argument('--dry-run', action='store_true', help="Report the changes without saving them.")
+        parser.add_argument('--backfill', action='store_true',
+                            help="First derive missing features from detection_details of older records.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        if options['backfill']:
+            self.backfill(batch_size, dry_run)
+
+        version = model_registry.version[:16]
+        records = UploadHistory.objects.filter(features__isnull=False, base_confidence__isnull=False)
+        # Clear-cut uploads analyzed before keypoint_count ran on every upload have no keypoint count to score
+        unscorable = UploadHistory.objects.count() - records.count()
+        if not options['all']:
+            records = records.exclude(model_version=version)
+
+        transitions = np.zeros((2, 2), dtype=np.int64)  # old verdict x new verdict
+        total = changed = 0
+        confidence_shift = 0.0
+        last_pk = 0
+        started = time.monotonic()
+
+        while True:
+            rows = list(
+                records.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'features', 'base_confidence', 'result', 'confidence')[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            ids, blobs, base, old_results, old_confidence = zip(*rows)
+
+            labels, probabilities = model_registry.predict_batch(feature_store.decode(blobs))
+            confidence, authentic = feature_store.verdicts(np.asarray(base, dtype=float), labels, probabilities)
+
+            old_tampered = np.asarray(old_results) == 'Tampered'
+            new_tampered = ~authentic
+            np.add.at(transitions, (old_tampered.astype(int), new_tampered.astype(int)), 1)
+            delta = np.abs(confidence - np.asarray(old_confidence, dtype=float))
+            modified = (old_tampered != new_tampered) | (delta > 1e-6)
+            confidence_shift += float(delta.sum())
+            total += len(ids)
+            changed += int(modified.sum())
+
+            if not dry_run:
+                self.save_batch(ids, modified, confidence, new_tampered, version)
+
+            rate = total / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"  {total} records scored, {changed} changed ({rate:.0f} records/s)")
+
+        self.report(transitions, total, changed, confidence_shift, time.monotonic() - started, dry_run)
+        if unscorable:
+            self.stdout.write(f"Skipped {unscorable} records without stored features (tier 2 did not run, "
+                              f"or the analysis failed); their verdicts were left as they are.")
+
+    def save_batch(self, ids, modified, confidence, tampered, version):
+        now = timezone.now()
+        updated = [
+            UploadHistory(pk=ids[i], result=RESULTS[int(tampered[i])], confidence=float(confidence[i]),
+                          model_version=version, rescored_at=now)
+            for i in np.flatnonzero(modified)
+        ]
+        unchanged = [ids[i] for i in np.flatnonzero(~modified)]
+        with transaction.atomic():
+            UploadHistory.objects.bulk_update(
+                updated, ['result', 'confidence', 'model_version', 'rescored_at'], batch_size=UPDATE_CHUNK)
+            # Same verdict: only record which model has seen the row; rescored_at
+            # stays put so history ETags do not change for nothing
+            for chunk in _chunks(unchanged, UPDATE_CHUNK):
+                UploadHistory.objects.filter(pk__in=chunk).update(model_version=version)
+
+    def backfill(self, batch_size, dry_run):
+        """Rebuild features for records saved before they were stored, from detection_details."""
+        filled = skipped = 0
+        last_pk = 0
+        pending = UploadHistory.objects.filter(features__isnull=True)
+        while True:
+            rows = list(
+                pending.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'detection_details', 'confidence')[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            updates = []
+            for pk, details, confidence in rows:
+                try:
+                    features = feature_store.from_checks(details['checks'])
+                except (KeyError, TypeError):
+                    skipped += 1  # failed analysis, or tier 2 skipped
+                    continue
+                ml = details['checks'].get('ml_classification', {})
+                base = ml.get('base_confidence')
+                if base is None and "ML model classified as tampered" not in details.get('reasons', []):
+                    base = confidence  # no override, so the stored score is the rule-based one
+                updates.append(UploadHistory(pk=pk, features=feature_store.encode(features), base_confidence=base))
+
+            filled += len(updates)
+            if not dry_run:
+                UploadHistory.objects.bulk_update(updates, ['features', 'base_confidence'], batch_size=UPDATE_CHUNK)
+        self.stdout.write(f"Backfilled features for {filled} records ({skipped} without usable details).")
+
+    def report(self, transitions, total, changed, confidence_shift, elapsed, dry_run):
+        self.stdout.write(f"{'Re-scored' if not dry_run else 'Would re-score'} {total} records "
+                          f"in {elapsed:.1f}s ({total / max(elapsed, 1e-6):.0f} records/s); {changed} changed.")
+        if not total:
+            return
+        self.stdout.write(f"Mean confidence shift: {confidence_shift / total:.2f} points")
+        self.stdout.write(f"{'before -> after':<24}{'records':>10}")
+        for old in range(2):
+            for new in range(2):
+                self.stdout.write(f"{RESULTS[old] + ' -> ' + RESULTS[new]:<24}{transitions[old, new]:>10}")
@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker(poll_interval, burst):
+    import django
+    django.setup()
+
+    from detection import jobs
+    from detection.warmup import warm_up
+
+    warm_up(force=True)
+    try:
+        jobs.work(poll_interval=poll_interval, burst=burst)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Run local worker processes that execute queued analysis jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int,
+            default=getattr(settings, 'DETECTION_JOB_WORKERS', None) or os.cpu_count(),
+            help="Number of worker processes (default: DETECTION_JOB_WORKERS or CPU count).",
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue has been drained.")
+
+    def handle(self, *args, **options):
+        # Children must open their own database connections
+        connections.close_all()
+
+        processes = [
+            multiprocessing.Process(target=_worker, args=(options['poll_interval'], options['burst']), daemon=False)
+            for _ in range(max(1, options['processes']))
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} detection worker(s).")
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
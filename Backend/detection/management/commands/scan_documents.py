@@ -0,0 +1,186 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.executor import init_worker_process
+
+EXTENSIONS = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.pdf': 'application/pdf',
+}
+CSV_FIELDS = ['path', 'status', 'confidence', 'reasons', 'skipped_checks', 'error', 'seconds']
+PROGRESS_INTERVAL = 5  # seconds between progress lines
+
+
+def _init_scan_worker():
+    import cv2
+
+    init_worker_process()
+    # The pool already keeps every core busy; OpenCV's own threads would only contend
+    cv2.setNumThreads(1)
+
+
+def scan_file(root, relative_path, mode, pages, details):
+    from detection.views import UploadView
+
+    started = time.perf_counter()
+    record = {'path': relative_path}
+    try:
+        with open(os.path.join(root, relative_path), 'rb') as f:
+            data = f.read()
+        content_type = EXTENSIONS[os.path.splitext(relative_path)[1].lower()]
+        results = UploadView().analyze_bytes(data, content_type, os.path.basename(relative_path),
+                                             pages=pages, mode=mode)
+        if results.get('error'):
+            status = 'error'  # the pipeline failed; its is_authentic=False is not a verdict
+        else:
+            status = "Original" if results['is_authentic'] else "Tampered"
+        record.update({
+            'status': status,
+            'confidence': results['confidence'],
+            'reasons': results['reasons'],
+            'skipped_checks': results.get('skipped_checks', []),
+            'error': results.get('error', ''),
+        })
+        if details:
+            record['details'] = results
+    except Exception as e:
+        record.update({'status': 'error', 'error': str(e)})
+    record['seconds'] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def walk(root):
+    """Relative paths of every supported document under ``root``, in a stable order."""
+    paths = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in EXTENSIONS:
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return paths
+
+
+class JsonlWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, record):
+        self.f.write(json.dumps(record, default=str) + '\n')
+
+
+class CsvWriter:
+    def __init__(self, f):
+        self.writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        if f.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, record):
+        row = dict(record)
+        for field in ('reasons', 'skipped_checks'):
+            row[field] = '; '.join(row.get(field) or [])
+        self.writer.writerow(row)
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Command(BaseCommand):
+    help = "Run the forensic pipeline over every image/PDF under a directory, resumably."
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', help="Directory to scan recursively.")
+        parser.add_argument('--output', required=True, help="Results file; .csv writes CSV, anything else JSONL.")
+        parser.add_argument('--checkpoint', help="Completed-files log (default: <output>.checkpoint).")
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--mode', default=getattr(settings, 'DETECTION_DEFAULT_MODE', 'standard'),
+                            choices=('fast', 'standard', 'thorough'))
+        parser.add_argument('--pages', default='first', help="PDF pages to analyze: first, all or 1,3.")
+        parser.add_argument('--details', action='store_true', help="Include the full results in JSONL output.")
+
+    def handle(self, *args, **options):
+        root = options['root']
+        if not os.path.isdir(root):
+            raise CommandError(f"{root} is not a directory.")
+        output = options['output']
+        checkpoint = options['checkpoint'] or output + '.checkpoint'
+
+        done = set()
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = {line.rstrip('\n') for line in f if line.strip()}
+
+        paths = walk(root)
+        pending = [path for path in paths if path not in done]
+        self.stdout.write(f"{len(paths)} documents found, {len(paths) - len(pending)} already done, "
+                          f"{len(pending)} to scan on {options['processes']} processes.")
+        if not pending:
+            return
+
+        with open(output, 'a', newline='') as out, open(checkpoint, 'a') as log:
+            writer = CsvWriter(out) if output.lower().endswith('.csv') else JsonlWriter(out)
+            self.scan(root, pending, writer, out, log, options)
+
+    def scan(self, root, pending, writer, out, log, options):
+        window = options['processes'] * 4  # submitted but unfinished files, to bound memory
+        total = len(pending)
+        completed = errors = 0
+        started = last_report = time.monotonic()
+        queue = iter(pending)
+
+        pool = futures.ProcessPoolExecutor(
+            max_workers=options['processes'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_scan_worker,
+        )
+        try:
+            running = set()
+            while True:
+                while len(running) < window:
+                    path = next(queue, None)
+                    if path is None:
+                        break
+                    running.add(pool.submit(scan_file, root, path, options['mode'], options['pages'],
+                                            options['details']))
+                if not running:
+                    break
+
+                finished, running = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    writer.write(record)
+                    errors += bool(record.get('error'))
+                    completed += 1
+                out.flush()
+                # Checkpoint only once the records are flushed, so a crash never skips a file
+                log.write(''.join(future.result()['path'] + '\n' for future in finished))
+                log.flush()
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL or completed == total:
+                    last_report = now
+                    rate = completed / (now - started)
+                    eta = (total - completed) / rate if rate else 0
+                    self.stdout.write(f"  {completed}/{total} ({100 * completed / total:.1f}%), "
+                                      f"{rate:.1f} files/s, ETA {_duration(eta)}, {errors} errors")
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.stdout.write(self.style.WARNING(
+                f"Interrupted after {completed} files; run the same command again to resume."))
+            return
+        pool.shutdown()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {completed} files in {_duration(elapsed)} ({completed / elapsed:.1f} files/s), "
+            f"{errors} errors."))
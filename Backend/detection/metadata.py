@@ -0,0 +1,226 @@
+import re
+import struct
+import zlib
+
+MAX_BYTES = 512 * 1024  # metadata read per file, whatever its size
+MAX_TEXT = 64 * 1024  # decompressed size of one PNG text chunk
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+PHOTOSHOP_HEADER = b'Photoshop 3.0\x00'
+
+# TIFF tags kept, by IFD; everything else is only counted
+IFD0_TAGS = {
+    0x000B: 'ProcessingSoftware',
+    0x010F: 'Make',
+    0x0110: 'Model',
+    0x0131: 'Software',
+    0x0132: 'DateTime',
+    0x013B: 'Artist',
+    0x013C: 'HostComputer',
+}
+EXIF_IFD_TAGS = {
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'DateTimeDigitized',
+}
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+MAX_IFD_ENTRIES = 1024
+
+# Image editors whose name in a software field means the file was re-saved by one
+EDITORS = re.compile(
+    r'photoshop|lightroom|gimp|affinity|paint\.net|paintshop|pixelmator|photopea|snapseed|'
+    r'picsart|canva|corel|krita|fotor|pixlr|luminar',
+    re.IGNORECASE,
+)
+SOFTWARE_TAGS = ('Software', 'ProcessingSoftware', 'HostComputer', 'CreatorTool')
+XMP_FIELDS = ('CreatorTool', 'CreateDate', 'ModifyDate', 'MetadataDate')
+
+
+def extract(data):
+    """Normalized metadata from the leading segments of a JPEG or PNG.
+
+    Reads at most MAX_BYTES and stops at the image data (JPEG SOS, PNG
+    IDAT), so the cost does not grow with the file. Returns the
+    exif_metadata check result: 'exists', 'count', 'software_used' and
+    'creation_date' as before, plus every kept 'tags' value, the
+    'sources' seen (exif, xmp, photoshop, comment, png_text),
+    'editor_traces' and 'bytes_read'.
+    """
+    meta = {'tags': {}, 'history': [], 'sources': [], 'exif_count': 0, 'bytes_read': 0}
+    if data[:2] == b'\xff\xd8':
+        _read_jpeg(data, meta)
+    elif data[:8] == PNG_SIGNATURE:
+        _read_png(data, meta)
+
+    tags = meta['tags']
+    return {
+        'exists': meta['exif_count'] > 0,
+        'count': meta['exif_count'],
+        'software_used': tags.get('Software', 'None'),
+        'creation_date': tags.get('DateTimeOriginal', 'None'),
+        'tags': tags,
+        'sources': meta['sources'],
+        'editor_traces': editor_traces(tags, meta['history'], meta['sources']),
+        'bytes_read': meta['bytes_read'],
+    }
+
+
+def editor_traces(tags, history, sources):
+    traces = []
+    for name in SOFTWARE_TAGS:
+        value = tags.get(name)
+        if value and EDITORS.search(value):
+            traces.append(f"{name}: {value}")
+    for agent in dict.fromkeys(history):  # XMP edit history, in order, without repeats
+        if EDITORS.search(agent):
+            traces.append(f"XMP history: {agent}")
+    comment = tags.get('Comment')
+    if comment and EDITORS.search(comment):
+        traces.append(f"Comment: {comment}")
+    if 'photoshop' in sources:
+        traces.append("Photoshop image resources (APP13)")
+    return traces
+
+
+def _add_source(meta, source):
+    if source not in meta['sources']:
+        meta['sources'].append(source)
+
+
+def _read_jpeg(data, meta):
+    pos, end = 2, len(data)
+    while pos + 4 <= end and meta['bytes_read'] < MAX_BYTES:
+        if data[pos] != 0xFF:
+            return  # corrupt; keep what was read
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # metadata always precedes the scan
+            return
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        meta['bytes_read'] += 4
+        if marker in (0xE1, 0xED, 0xFE):
+            segment = bytes(data[pos + 4:pos + 2 + length])
+            meta['bytes_read'] += len(segment)
+            if marker == 0xE1 and segment.startswith(EXIF_HEADER):
+                _read_tiff(segment[len(EXIF_HEADER):], meta)
+            elif marker == 0xE1 and segment.startswith(XMP_HEADER):
+                _read_xmp(segment[len(XMP_HEADER):], meta)
+            elif marker == 0xED and segment.startswith(PHOTOSHOP_HEADER):
+                _add_source(meta, 'photoshop')
+            elif marker == 0xFE:
+                _set_text(meta, 'Comment', segment)
+                _add_source(meta, 'comment')
+        pos += 2 + length
+
+
+def _read_png(data, meta):
+    pos, end = len(PNG_SIGNATURE), len(data)
+    while pos + 8 <= end and meta['bytes_read'] < MAX_BYTES:
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        meta['bytes_read'] += 12
+        if kind in (b'IDAT', b'IEND'):
+            return
+        if kind in (b'tEXt', b'zTXt', b'iTXt', b'eXIf'):
+            chunk = bytes(data[pos + 8:pos + 8 + length])
+            meta['bytes_read'] += len(chunk)
+            if kind == b'eXIf':
+                _read_tiff(chunk, meta)
+            else:
+                _read_png_text(kind, chunk, meta)
+        pos += 12 + length
+
+
+def _read_png_text(kind, chunk, meta):
+    keyword, _, rest = chunk.partition(b'\x00')
+    keyword = keyword.decode('latin-1')
+    try:
+        if kind == b'tEXt':
+            text = rest
+        elif kind == b'zTXt':
+            text = zlib.decompressobj().decompress(rest[1:], MAX_TEXT)
+        else:  # iTXt: compression flag, method, language and translated keyword, then UTF-8 text
+            compressed = rest[:1] == b'\x01'
+            _, _, rest = rest[2:].partition(b'\x00')
+            _, _, text = rest.partition(b'\x00')
+            if compressed:
+                text = zlib.decompressobj().decompress(text, MAX_TEXT)
+    except zlib.error:
+        return
+    if keyword == 'XML:com.adobe.xmp':
+        _read_xmp(text, meta)
+        return
+    _add_source(meta, 'png_text')
+    # PNG's standard keywords, mapped onto the names the EXIF tags use
+    name = {'Creation Time': 'DateTimeOriginal', 'Author': 'Artist'}.get(keyword, keyword)
+    _set_text(meta, name, text)
+
+
+def _set_text(meta, name, raw):
+    value = raw.decode('utf-8', 'replace').strip('\x00 \r\n\t')
+    if value:
+        meta['tags'].setdefault(name, value[:256])
+
+
+def _read_tiff(tiff, meta):
+    if len(tiff) < 8 or tiff[:4] not in (b'II*\x00', b'MM\x00*'):
+        return
+    _add_source(meta, 'exif')
+    order = '<' if tiff[:2] == b'II' else '>'
+    seen = set()
+    pointers = _read_ifd(tiff, order, struct.unpack(order + 'I', tiff[4:8])[0], IFD0_TAGS, meta, seen)
+    for pointer, names in ((EXIF_IFD_POINTER, EXIF_IFD_TAGS), (GPS_IFD_POINTER, {})):
+        if pointer in pointers:
+            _read_ifd(tiff, order, pointers[pointer], names, meta, seen)
+
+
+def _read_ifd(tiff, order, offset, names, meta, seen):
+    """Read one IFD's entries: keep the ASCII values in ``names``, return the sub-IFD pointers."""
+    pointers = {}
+    if offset in seen or offset + 2 > len(tiff):
+        return pointers
+    seen.add(offset)
+    count = min(struct.unpack(order + 'H', tiff[offset:offset + 2])[0], MAX_IFD_ENTRIES)
+    for index in range(count):
+        entry = offset + 2 + 12 * index
+        if entry + 12 > len(tiff):
+            break
+        tag, kind, items = struct.unpack(order + 'HHI', tiff[entry:entry + 8])
+        meta['exif_count'] += 1
+        if tag in (EXIF_IFD_POINTER, GPS_IFD_POINTER) and kind == 4:
+            pointers[tag] = struct.unpack(order + 'I', tiff[entry + 8:entry + 12])[0]
+        elif tag in names and kind == 2:
+            size = items * TYPE_SIZES[kind]
+            if size <= 4:
+                raw = tiff[entry + 8:entry + 8 + size]
+            else:
+                start = struct.unpack(order + 'I', tiff[entry + 8:entry + 12])[0]
+                raw = tiff[start:start + size]
+            if len(raw) == size:  # a value cut off by the segment's end is not kept
+                _set_text(meta, names[tag], raw)
+    return pointers
+
+
+def _xmp_values(xmp, name):
+    """Values of an XMP property written as an attribute or as a simple element."""
+    pattern = rf'{name}="([^"]*)"|<{name}>([^<]*)</{name}>'
+    return [attribute or element for attribute, element in re.findall(pattern, xmp)]
+
+
+def _read_xmp(raw, meta):
+    # Pattern matching rather than an XML parser: no entity expansion from untrusted packets
+    xmp = raw.decode('utf-8', 'replace')
+    _add_source(meta, 'xmp')
+    for field in XMP_FIELDS:
+        values = _xmp_values(xmp, f'xmp:{field}')
+        if values:
+            _set_text(meta, field, values[0].encode())
+    meta['history'] += [agent.strip() for agent in _xmp_values(xmp, 'stEvt:softwareAgent') if agent.strip()]
+    if 'photoshop:' in xmp:
+        meta['history'].append('Adobe Photoshop (photoshop: XMP namespace)')
@@ -0,0 +1,193 @@
+import bisect
+import contextlib
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Histogram buckets in seconds: a cached lookup is ~1 ms, a multi-page PDF can take a minute
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def enabled():
+    return getattr(settings, 'DETECTION_METRICS', False)
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far (KiB on Linux), 0 where unavailable."""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not enabled():
+            return
+        key = tuple(str(labels.get(n, '')) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f'{self.name}{_labels(self.labels, key)} {value}' for key, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not enabled():
+            return
+        key = tuple(str(labels.get(n, '')) for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = _labels(self.labels + ('le',), key + (bound,))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), key + ("+Inf",))} {values[-2]}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {values[-2]}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {round(values[-1], 6)}')
+        return lines
+
+
+uploads = Counter('detection_uploads_total', 'Documents submitted for analysis.', ('content_type',))
+check_errors = Counter('detection_check_errors_total', 'Checks that failed or timed out.', ('check',))
+span_seconds = Histogram('detection_span_seconds', 'Time spent in each instrumented stage.', ('span',))
+span_rss = Counter('detection_span_peak_rss_growth_kb_total',
+                   'Growth of the process peak RSS observed while a stage ran.', ('span',))
+admission_rejections = Counter('detection_admission_rejections_total',
+                               'Uploads turned away by admission control.', ('reason',))
+
+
+class Trace:
+    """Timing spans for one request.
+
+    Spans opened from the check threads overlap, so a peak-RSS delta tells how
+    much the process high-water mark grew while that stage ran, not how much
+    that stage alone allocated.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        rss = peak_rss_kb()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            growth = peak_rss_kb() - rss
+            with self._lock:
+                self.spans.append(dict(attrs, name=name, ms=round(elapsed * 1000, 2), peak_rss_delta_kb=growth))
+            span_seconds.observe(elapsed, span=name)
+            if growth:
+                span_rss.inc(growth, span=name)
+
+    def timed(self, name, fn):
+        def run(*args, **kwargs):
+            with self.span(name):
+                return fn(*args, **kwargs)
+        return run
+
+    def as_list(self):
+        with self._lock:
+            return list(self.spans)
+
+
+class NullTrace:
+    """Stand-in used when instrumentation is off: no clock reads, no allocations."""
+
+    _null = contextlib.nullcontext()
+    spans = ()
+
+    def span(self, name, **attrs):
+        return self._null
+
+    def timed(self, name, fn):
+        return fn
+
+    def as_list(self):
+        return []
+
+
+NULL_TRACE = NullTrace()
+
+
+def start_trace(force=False):
+    """A recording Trace when metrics are on (or timings were asked for), else NULL_TRACE."""
+    return Trace() if force or enabled() else NULL_TRACE
+
+
+def render():
+    from detection import admission
+    from detection.cache import result_cache
+
+    lines = []
+    for metric in (uploads, check_errors, span_seconds, span_rss, admission_rejections):
+        lines += metric.render()
+
+    stats = result_cache.stats()
+    lines += [
+        '# HELP detection_cache_requests_total Result cache lookups.',
+        '# TYPE detection_cache_requests_total counter',
+        f'detection_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'detection_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        '# HELP detection_process_peak_rss_kb Peak resident set size of this worker process.',
+        '# TYPE detection_process_peak_rss_kb gauge',
+        f'detection_process_peak_rss_kb {peak_rss_kb()}',
+    ]
+    queue = admission.stats()
+    if queue['capacity']:
+        lines += [
+            '# HELP detection_admission_in_use Capacity units taken by running analyses.',
+            '# TYPE detection_admission_in_use gauge',
+            f'detection_admission_in_use {queue["in_use"]}',
+            '# HELP detection_admission_queue_depth Uploads waiting for analysis capacity.',
+            '# TYPE detection_admission_queue_depth gauge',
+            f'detection_admission_queue_depth {queue["queued"]}',
+        ]
+    return '\n'.join(lines) + '\n'
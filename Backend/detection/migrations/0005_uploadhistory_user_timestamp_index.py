@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0004_analysisjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadhistory',
+            index=models.Index(fields=['user', '-timestamp'], name='detection_history_user_ts_idx'),
+        ),
+    ]
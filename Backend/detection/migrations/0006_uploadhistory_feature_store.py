@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0005_uploadhistory_user_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='base_confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='features',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='rescored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_uploadhistory_feature_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('global', 'Whole image'), ('face', 'Photo area')], max_length=8)),
+                ('value', models.BigIntegerField()),
+                ('chunk_0', models.IntegerField()),
+                ('chunk_1', models.IntegerField()),
+                ('chunk_2', models.IntegerField()),
+                ('chunk_3', models.IntegerField()),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hashes', to='detection.uploadhistory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'chunk_0'], name='detection_hash_chunk_0_idx'), models.Index(fields=['kind', 'chunk_1'], name='detection_hash_chunk_1_idx'), models.Index(fields=['kind', 'chunk_2'], name='detection_hash_chunk_2_idx'), models.Index(fields=['kind', 'chunk_3'], name='detection_hash_chunk_3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0007_imagehash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='imagehash',
+            name='detection_hash_chunk_0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='imagehash',
+            name='detection_hash_chunk_1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='imagehash',
+            name='detection_hash_chunk_2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='imagehash',
+            name='detection_hash_chunk_3_idx',
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['kind', 'chunk_0', '-history'], name='detection_hash_chunk_0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['kind', 'chunk_1', '-history'], name='detection_hash_chunk_1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['kind', 'chunk_2', '-history'], name='detection_hash_chunk_2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['kind', 'chunk_3', '-history'], name='detection_hash_chunk_3_idx'),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from detection import feature_store
 
 class UploadHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -8,6 +13,98 @@ class UploadHistory(models.Model):
     confidence = models.FloatField()
     detection_details = models.JSONField(default=dict)  # <-- Add this line
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Classifier input as packed float32 (see detection.feature_store), so past
+    # uploads can be re-scored by a retrained model without rerunning the checks
+    features = models.BinaryField(null=True, blank=True, editable=False)
+    base_confidence = models.FloatField(null=True, blank=True)  # rule-based score before the model override
+    model_version = models.CharField(max_length=16, blank=True)
+    rescored_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', '-timestamp'], name='detection_history_user_ts_idx'),
+        ]
+
+    @classmethod
+    def from_results(cls, user, image, results):
+        checks = results.get('checks', {})
+        ml = checks.get('ml_classification', {})
+        features = base_confidence = None
+        if 'error' not in results and feature_store.has_inputs(checks):
+            # Results from before keypoint_count have none when tier 2 was skipped; rescore_history reports those rows
+            features = feature_store.encode(feature_store.from_checks(checks))
+            base_confidence = ml.get('base_confidence', results['confidence'])
+        return cls(
+            user=user,
+            image=image,
+            result="Original" if results['is_authentic'] else "Tampered",
+            confidence=results['confidence'],
+            detection_details=results,
+            features=features,
+            base_confidence=base_confidence,
+            model_version=ml.get('model_version', ''),
+        )
+
+
+class ImageHash(models.Model):
+    """A 64-bit perceptual hash of an upload, split into four 16-bit chunks for lookup (see detection.phash)."""
+    GLOBAL = 'global'
+    FACE = 'face'
+    KIND_CHOICES = [
+        (GLOBAL, 'Whole image'),
+        (FACE, 'Photo area'),
+    ]
+
+    history = models.ForeignKey(UploadHistory, on_delete=models.CASCADE, related_name='hashes')
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    value = models.BigIntegerField()  # the unsigned hash stored as signed 64-bit
+    chunk_0 = models.IntegerField()
+    chunk_1 = models.IntegerField()
+    chunk_2 = models.IntegerField()
+    chunk_3 = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            # history last, so a capped lookup reads the newest rows straight off the index
+            models.Index(fields=['kind', f'chunk_{i}', '-history'], name=f'detection_hash_chunk_{i}_idx')
+            for i in range(4)
+        ]
+
+
+class AnalysisJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE)
+    upload = models.FileField(upload_to='uploads/')
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    history = models.ForeignKey(UploadHistory, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='detection_job_queue_idx'),
+        ]
@@ -0,0 +1,225 @@
+import bisect
+import logging
+import queue
+import threading
+
+import numpy as np
+import cv2
+from PIL import Image
+import pytesseract
+from django.conf import settings
+
+try:
+    import tesserocr
+except ImportError:  # optional: in-process engine, falls back to the tesseract CLI
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+DETECT_MAX_SIDE = 1600  # text regions are located on a copy no larger than this
+TEXT_HEIGHT = 40  # region height (px) tesseract is fed; roughly 30 px capitals
+MAX_REGIONS = 80
+MAX_WORDS = 200
+STRIP_GAP = 12
+ACQUIRE_TIMEOUT = 30  # seconds a request waits for a pooled tesserocr API
+
+
+def find_text_regions(gray, max_side=DETECT_MAX_SIDE, max_regions=MAX_REGIONS):
+    """Locate line-like text regions and return their boxes in ``gray`` coordinates."""
+    scale = min(1.0, max_side / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    gradient = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    joined = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    contours, _ = cv2.findContours(joined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < 8 or h > 0.2 * small.shape[0]:
+            continue
+        if cv2.countNonZero(binary[y:y + h, x:x + w]) < 0.2 * w * h:
+            continue
+        regions.append((x, y, w, h))
+
+    regions = [r for r in merge_lines(regions) if r[2] >= r[3]]
+    regions = sorted(regions, key=lambda r: r[2] * r[3], reverse=True)[:max_regions]
+    regions.sort(key=lambda r: (r[1], r[0]))
+
+    pad = 2
+    height, width = gray.shape
+    boxes = []
+    for x, y, w, h in regions:
+        x0, y0 = max(0, int(x / scale) - pad), max(0, int(y / scale) - pad)
+        x1, y1 = min(width, int((x + w) / scale) + pad), min(height, int((y + h) / scale) + pad)
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+    return boxes
+
+
+def merge_lines(boxes):
+    """Join word boxes that sit on the same text line into one line box."""
+    lines = []
+    for x, y, w, h in sorted(boxes, key=lambda b: (b[0], b[1])):
+        for i, (lx, ly, lw, lh) in enumerate(lines):
+            overlap = min(y + h, ly + lh) - max(y, ly)
+            gap = x - (lx + lw)
+            if overlap > 0.5 * min(h, lh) and gap < 1.5 * max(h, lh):
+                x0, y0 = min(x, lx), min(y, ly)
+                lines[i] = (x0, y0, max(x + w, lx + lw) - x0, max(y + h, ly + lh) - y0)
+                break
+        else:
+            lines.append((x, y, w, h))
+    return lines
+
+
+def ocr_scale(boxes, text_height=TEXT_HEIGHT):
+    """Scale that brings the median region height to ``text_height``, within [0.25, 2]."""
+    if not boxes:
+        return 1.0
+    median = float(np.median([h for _, _, _, h in boxes]))
+    return float(np.clip(text_height / median, 0.25, 2.0))
+
+
+class TesserocrEngine:
+    """A pool of initialised in-process tesseract APIs, one per concurrent caller."""
+
+    name = 'tesserocr'
+
+    def __init__(self, size, lang='eng', timeout=ACQUIRE_TIMEOUT):
+        self.size = size
+        self.lang = lang
+        self.timeout = timeout
+        self._apis = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        apis = [self._acquire() for _ in range(self.size)]
+        for api in apis:
+            self._apis.put(api)
+
+    def _acquire(self):
+        try:
+            return self._apis.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                # Count the slot only once the API exists, so a failed init (missing tessdata) can be retried
+                api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=tesserocr.PSM.SINGLE_LINE)
+                self._created += 1
+                return api
+        try:
+            return self._apis.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No OCR engine became free within {self.timeout} s.") from None
+
+    def recognize(self, image, boxes):
+        """OCR each box of ``image`` (already at OCR scale); returns a word list per box."""
+        api = self._acquire()
+        try:
+            api.SetImage(Image.fromarray(image))
+            lines = []
+            for x, y, w, h in boxes:
+                api.SetRectangle(x, y, w, h)
+                api.Recognize()
+                words = []
+                iterator = api.GetIterator()
+                level = tesserocr.RIL.WORD
+                for word in tesserocr.iterate_level(iterator, level):
+                    text = (word.GetUTF8Text(level) or '').strip()
+                    box = word.BoundingBox(level)
+                    if text and box:
+                        left, top, right, bottom = box
+                        words.append((text, float(word.Confidence(level)), (left, top, right - left, bottom - top)))
+                lines.append(words)
+            return lines
+        finally:
+            api.Clear()
+            self._apis.put(api)
+
+
+class TesseractCLIEngine:
+    """Fallback: one tesseract process per request over a strip of the text regions."""
+
+    name = 'tesseract-cli'
+
+    def warm_up(self):
+        # Nothing to keep warm: each call starts its own tesseract process
+        pass
+
+    def recognize(self, image, boxes):
+        if not boxes:
+            return []
+        width = max(w for _, _, w, _ in boxes)
+        height = sum(h for _, _, _, h in boxes) + STRIP_GAP * (len(boxes) + 1)
+        strip = np.full((height, width), 255, dtype=np.uint8)
+
+        offsets = []
+        top = STRIP_GAP
+        for x, y, w, h in boxes:
+            strip[top:top + h, :w] = image[y:y + h, x:x + w]
+            offsets.append(top)
+            top += h + STRIP_GAP
+
+        data = pytesseract.image_to_data(strip, config='--psm 6', output_type=pytesseract.Output.DICT)
+        lines = [[] for _ in boxes]
+        for text, conf, left, top, w, h in zip(data['text'], data['conf'], data['left'],
+                                                data['top'], data['width'], data['height']):
+            text = text.strip()
+            if not text or float(conf) < 0:
+                continue
+            index = max(0, bisect.bisect_right(offsets, top + h // 2) - 1)
+            x, y = boxes[index][:2]
+            lines[index].append((text, float(conf), (x + left, y + top - offsets[index], w, h)))
+        return lines
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if tesserocr is not None:
+                    size = getattr(settings, 'DETECTION_OCR_ENGINES', None) or 2
+                    _engine = TesserocrEngine(size, lang=getattr(settings, 'DETECTION_OCR_LANG', 'eng'),
+                                              timeout=getattr(settings, 'DETECTION_OCR_TIMEOUT', ACQUIRE_TIMEOUT))
+                else:
+                    logger.warning("tesserocr is not installed; OCR starts a tesseract process per request")
+                    _engine = TesseractCLIEngine()
+    return _engine
+
+
+def read_text(gray):
+    """OCR only the detected text regions of ``gray`` at a text-sized resolution.
+
+    Returns lines (one per region, top to bottom) of ``(text, confidence, box)``
+    words, with boxes in ``gray`` coordinates.
+    """
+    boxes = find_text_regions(gray)
+    scale = ocr_scale(boxes, getattr(settings, 'DETECTION_OCR_TEXT_HEIGHT', TEXT_HEIGHT))
+    if scale != 1.0:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        image = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+    else:
+        image = gray
+
+    height, width = image.shape
+    scaled = []
+    for box in boxes:
+        x, y, w, h = (int(round(v * scale)) for v in box)
+        w, h = min(w, width - x), min(h, height - y)
+        if w > 0 and h > 0:
+            scaled.append((x, y, w, h))
+
+    engine = get_engine()
+    lines = engine.recognize(image, scaled)
+    return engine.name, [
+        [(text, conf, tuple(int(round(v / scale)) for v in box)) for text, conf, box in words]
+        for words in lines
+    ]
@@ -0,0 +1,175 @@
+import itertools
+import threading
+
+import numpy as np
+import cv2
+from django.conf import settings
+
+from detection.models import ImageHash, UploadHistory
+
+DCT_SIZE = 32  # the image is reduced to this before the DCT ...
+HASH_SIZE = 8  # ... and the lowest HASH_SIZE x HASH_SIZE frequencies give the 64 bits
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+RADIUS = 6  # bits two photo-area hashes may differ by and still be reported
+# Documents of one type share a template, so their whole-image hashes sit a
+# few bits apart whatever the photo: only near-copies of the whole page count
+GLOBAL_RADIUS = 2
+MATCHES = 5
+CANDIDATES = 200  # rows read per chunk query, newest first, so a crowded bucket cannot turn a lookup into a scan
+FACE_DETECT_SIDE = 640  # faces are searched for on a copy no larger than this
+FACE_MIN_SIZE = 0.05  # of the detection copy's shorter side
+# An ID photo is the face plus hair, neck and the photo's border
+FACE_MARGIN_X = 0.4
+FACE_MARGIN_Y = 0.6
+
+_local = threading.local()  # CascadeClassifier is not safe to share between threads
+
+
+def _setting(name, default):
+    return getattr(settings, f'DETECTION_PHASH_{name}', default)
+
+
+def phash(gray):
+    """64-bit DCT perceptual hash: one bit per low frequency, set when above the median."""
+    small = cv2.resize(gray, (DCT_SIZE, DCT_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])  # the DC term only says how bright the image is
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def _cascade():
+    """This thread's frontal-face cascade, or None when the OpenCV build ships without one."""
+    if not hasattr(_local, 'cascade'):
+        cascade = None
+        if hasattr(cv2, 'CascadeClassifier') and hasattr(cv2, 'data'):
+            cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        _local.cascade = None if cascade is None or cascade.empty() else cascade
+    return _local.cascade
+
+
+def photo_region(gray):
+    """The ID photo around the largest face, as (x, y, w, h) in ``gray``'s pixels, or None."""
+    if _cascade() is None:
+        return None
+    scale = min(1.0, FACE_DETECT_SIDE / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+    side = max(int(min(small.shape) * FACE_MIN_SIZE), 20)
+    faces = _cascade().detectMultiScale(small, scaleFactor=1.1, minNeighbors=5, minSize=(side, side))
+    if len(faces) == 0:
+        return None
+    x, y, w, h = (v / scale for v in max(faces, key=lambda f: f[2] * f[3]))
+    left, top = max(0, int(x - w * FACE_MARGIN_X)), max(0, int(y - h * FACE_MARGIN_Y))
+    right = min(gray.shape[1], int(x + w * (1 + FACE_MARGIN_X)))
+    bottom = min(gray.shape[0], int(y + h * (1 + FACE_MARGIN_Y)))
+    return left, top, right - left, bottom - top
+
+
+def compute(gray):
+    """Hex hashes of the whole image and, when a face is found, of its photo area."""
+    result = {ImageHash.GLOBAL: f'{phash(gray):016x}', ImageHash.FACE: None}
+    region = photo_region(gray)
+    if region is not None:
+        x, y, w, h = region
+        result[ImageHash.FACE] = f'{phash(gray[y:y + h, x:x + w]):016x}'
+        result['face_region'] = list(region)
+    return result
+
+
+def hashes_of(results):
+    """(kind, hash) pairs from a detection result, across the pages of a PDF."""
+    pairs = []
+    for page in results.get('pages') or [results]:
+        hashes = page.get('checks', {}).get('perceptual_hash', {})
+        for kind in (ImageHash.FACE, ImageHash.GLOBAL):
+            if hashes.get(kind) and (kind, int(hashes[kind], 16)) not in pairs:
+                pairs.append((kind, int(hashes[kind], 16)))
+    return pairs
+
+
+def chunks(value):
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+def _signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _neighbours(chunk, radius):
+    """Every chunk value within ``radius`` bits of ``chunk``."""
+    values = [chunk]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), r):
+            values.append(chunk ^ sum(1 << b for b in bits))
+    return values
+
+
+def radius_of(kind):
+    if kind == ImageHash.GLOBAL:
+        return _setting('GLOBAL_RADIUS', GLOBAL_RADIUS)
+    return _setting('RADIUS', RADIUS)
+
+
+def similar(results, user_id=None, limit=None):
+    """Earlier uploads, from any account, that reuse this result's photo or whole page; closest first.
+
+    Photo-area matches (within DETECTION_PHASH_RADIUS bits) rank before
+    whole-image ones (within the tighter DETECTION_PHASH_GLOBAL_RADIUS).
+    Another account's upload is reported only by kind, distance and verdict;
+    the history id and timestamp are given for ``user_id``'s own uploads.
+
+    Multi-index lookup: two hashes within ``radius`` bits have at least one
+    16-bit chunk within ``radius // 4`` bits of each other, so an indexed
+    IN query per chunk finds the candidates. The queries are kept separate
+    because not every backend combines indexes across an OR, and each reads
+    at most DETECTION_PHASH_CANDIDATES rows, newest first. Candidates are
+    then checked on the full 64 bits. Each upload is reported once, at its
+    best match.
+    """
+    limit = _setting('MATCHES', MATCHES) if limit is None else limit
+    per_chunk = _setting('CANDIDATES', CANDIDATES)
+    best = {}
+    for kind, value in hashes_of(results):
+        radius = radius_of(kind)
+        candidates = set()
+        for i, chunk in enumerate(chunks(value)):
+            candidates.update(ImageHash.objects.filter(
+                kind=kind, **{f'chunk_{i}__in': _neighbours(chunk, radius // CHUNKS)}
+            ).order_by('-history_id').values_list('history_id', 'value')[:per_chunk])
+        rank = 0 if kind == ImageHash.FACE else 1
+        for history_id, stored in candidates:
+            distance = ((stored & (1 << 64) - 1) ^ value).bit_count()
+            if distance <= radius and (rank, distance) < best.get(history_id, (2, 0, None))[:2]:
+                best[history_id] = (rank, distance, kind)
+
+    closest = sorted(best.items(), key=lambda item: (item[1][:2], -item[0]))[:limit]
+    uploads = UploadHistory.objects.only('user_id', 'result', 'timestamp').in_bulk(
+        [history_id for history_id, _ in closest])
+    matches = []
+    for history_id, (_, distance, kind) in closest:
+        upload = uploads.get(history_id)
+        if upload is None:
+            continue
+        match = {'kind': kind, 'distance': distance, 'result': upload.result,
+                 'own_upload': user_id is not None and upload.user_id == user_id}
+        if match['own_upload']:
+            match.update(history_id=history_id, timestamp=upload.timestamp.isoformat())
+        matches.append(match)
+    return matches
+
+
+def index(histories):
+    """Store the hashes of saved UploadHistory rows so later uploads can find them.
+
+    Rows without a primary key (bulk_create on a backend that does not
+    return ids) are skipped.
+    """
+    rows = [
+        ImageHash(history=history, kind=kind, value=_signed(value),
+                  **{f'chunk_{i}': chunk for i, chunk in enumerate(chunks(value))})
+        for history in histories if history.pk is not None
+        for kind, value in hashes_of(history.detection_details)
+    ]
+    ImageHash.objects.bulk_create(rows)
+    return len(rows)
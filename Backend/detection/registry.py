@@ -0,0 +1,92 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from detection.lazy import LazyModule
+
+np = LazyModule('numpy')
+joblib = LazyModule('joblib')
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MODEL_PATH = os.path.join(BASE_DIR, "detection", "model", "id_classifier.pkl")
+
+
+class ModelRegistry:
+    """Keeps one unpickled classifier per worker process.
+
+    The model file is re-checked at most every ``check_interval`` seconds; a
+    changed mtime/size triggers a hash comparison, and a changed hash swaps in
+    the freshly loaded model in a single reference assignment.
+    """
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entry = None  # (model, stat_key, sha256)
+        self._next_check = 0.0
+
+    @property
+    def version(self):
+        return self._current()[2]
+
+    def get(self):
+        return self._current()[0]
+
+    def warm_up(self):
+        model = self.get()
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features:
+            model.predict_proba(np.zeros((1, n_features)))
+        return model
+
+    def predict(self, features):
+        model = self.get()
+        proba = model.predict_proba(np.asarray([features], dtype=float))[0]
+        best = int(np.argmax(proba))
+        return model.classes_[best], proba[best]
+
+    def predict_batch(self, matrix):
+        """Labels and their probabilities for every row, from one predict_proba call."""
+        model = self.get()
+        proba = model.predict_proba(np.asarray(matrix, dtype=float))
+        best = proba.argmax(axis=1)
+        return model.classes_[best], proba[np.arange(len(best)), best]
+
+    def _current(self):
+        entry = self._entry
+        now = time.monotonic()
+        if entry is not None and now < self._next_check:
+            return entry
+        with self._lock:
+            if self._entry is not None and now < self._next_check:
+                return self._entry
+            self._entry = self._refresh(self._entry)
+            self._next_check = now + self.check_interval
+            return self._entry
+
+    def _refresh(self, entry):
+        stat = os.stat(self.path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if entry is not None and entry[1] == stat_key:
+            return entry
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry is not None and entry[2] == digest:
+            return (entry[0], stat_key, digest)
+
+        model = joblib.load(io.BytesIO(data))
+        return (model, stat_key, digest)
+
+
+model_registry = ModelRegistry(
+    getattr(settings, 'DETECTION_MODEL_PATH', MODEL_PATH),
+    check_interval=getattr(settings, 'DETECTION_MODEL_RELOAD_INTERVAL', 5.0),
+)
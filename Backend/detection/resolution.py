@@ -0,0 +1,27 @@
+import math
+
+from django.conf import settings
+
+# Largest image (in pixels) each check works on; None keeps native resolution.
+# ELA and noise measure pixel-level statistics and stay at or near native size;
+# edges, SIFT and OCR need far less detail than a 48 MP phone photo carries.
+DEFAULT_POLICY = {
+    'error_level_analysis': None,
+    'noise_analysis': 24_000_000,
+    'edge_analysis': 2_000_000,
+    'copy_move_detection': 2_560_000,
+    'text_analysis': 4_000_000,
+}
+
+
+def max_pixels(check):
+    policy = getattr(settings, 'DETECTION_WORKING_RESOLUTION', {})
+    return policy.get(check, DEFAULT_POLICY.get(check))
+
+
+def working_scale(shape, limit):
+    """Linear scale (<= 1) that brings an image of ``shape`` within ``limit`` pixels."""
+    pixels = shape[0] * shape[1]
+    if not limit or pixels <= limit:
+        return 1.0
+    return math.sqrt(limit / pixels)
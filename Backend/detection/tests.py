@@ -1,3 +1,477 @@
-from django.test import TestCase
+import io
+import json
+import struct
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+from unittest import mock
+import zlib
 
-# Create your tests here.
+import cv2
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image, PngImagePlugin
+from rest_framework_simplejwt.tokens import AccessToken
+
+from detection import admission, benchmarks, copy_move, feature_store, jobs, jpeg, metadata, ocr, phash, views
+from detection.context import AnalysisContext
+from detection.management.commands.scan_documents import scan_file
+from detection.ingest import map_file
+from detection.models import AnalysisJob, ImageHash, UploadHistory
+from detection.views import AsyncHistoryView, AsyncUploadView, BatchUploadView, HistoryDetailView, HistoryView, UploadView
+
+
+def text_page(width=1200, height=800, seed=1):
+    """A plain page of random capitals and digits, line after line."""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 235, np.uint8)
+    for y in range(50, height - 20, 36):
+        line = ''.join(rng.choice(list("ABCDEFGHIJ KLMNOP0123456789"), 40))
+        cv2.putText(page, line, (30, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 20, 2)
+    return page
+
+
+def jpeg_bytes(quality=75, size=(64, 48)):
+    return benchmarks.encode_jpeg(np.full((size[1], size[0], 3), 128, np.uint8), quality)
+
+
+def segment(marker, payload):
+    return bytes([0xFF, marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def tiff(order):
+    """A TIFF block with Make inline, Software by offset and a DateTimeOriginal in the EXIF IFD."""
+    def ifd(entries):
+        body = struct.pack(order + 'H', len(entries))
+        for tag, kind, count, value in entries:
+            body += struct.pack(order + 'HHI', tag, kind, count) + value
+        return body + struct.pack(order + 'I', 0)
+
+    software, date = b'Adobe Photoshop 25.0\x00', b'2024:01:02 03:04:05\x00'
+    ifd0_size, exif_size = 2 + 3 * 12 + 4, 2 + 12 + 4
+    exif_at = 8 + ifd0_size
+    software_at = exif_at + exif_size
+    date_at = software_at + len(software)
+    ifd0 = ifd([
+        (0x010F, 2, 4, b'Nik\x00'),
+        (0x0131, 2, len(software), struct.pack(order + 'I', software_at)),
+        (0x8769, 4, 1, struct.pack(order + 'I', exif_at)),
+    ])
+    exif = ifd([(0x9003, 2, len(date), struct.pack(order + 'I', date_at))])
+    head = (b'II*\x00' if order == '<' else b'MM\x00*') + struct.pack(order + 'I', 8)
+    return head + ifd0 + exif + software + date
+
+
+def with_segments(data, *segments):
+    """``data`` (a JPEG) with ``segments`` inserted right after its SOI marker."""
+    return data[:2] + b''.join(segments) + data[2:]
+
+
+def png_chunk(kind, payload):
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+
+class JpegHeaderTests(SimpleTestCase):
+    def test_tables_and_frame_are_read(self):
+        header = jpeg.read_header(jpeg_bytes(75))
+        self.assertEqual((header['width'], header['height'], header['progressive']), (64, 48, False))
+        self.assertEqual(jpeg.subsampling(header['components']), '4:2:0')
+        luminance, chrominance = header['tables'][0], header['tables'][1]
+        self.assertEqual(luminance.ravel().tolist(), jpeg.IJG_LUMINANCE[74].tolist())
+        self.assertEqual(jpeg.estimate_quality(luminance, chrominance), (75, True))
+
+    def test_custom_tables_give_the_nearest_quality(self):
+        luminance = jpeg.IJG_LUMINANCE[89].copy()
+        luminance[-1] += 3
+        self.assertEqual(jpeg.estimate_quality(luminance), (90, False))
+
+    def test_sixteen_bit_table(self):
+        values = np.arange(1, 65, dtype='>u2')
+        data = with_segments(jpeg_bytes(), segment(0xDB, bytes([0x13]) + values.tobytes()))
+        table = jpeg.read_header(data)['tables'][3]
+        self.assertEqual(table.ravel()[jpeg.ZIGZAG].tolist(), values.tolist())
+
+    def test_truncated_and_malformed_headers_raise_value_error(self):
+        data = jpeg_bytes()
+        sof = data.index(b'\xff\xc0')
+        broken = {
+            'not a jpeg': b'GIF89a' + data,
+            'cut inside a segment': data[:30],
+            'no frame header': data[:sof],
+            'garbage between segments': data[:sof] + b'\x00' + data[sof:],
+            'short table': with_segments(data, segment(0xDB, b'\x00' + bytes(10))),
+            'short frame header': data[:sof] + segment(0xC0, b'\x08\x00\x30\x00\x40\x03\x01'),
+        }
+        for name, data in broken.items():
+            with self.subTest(name), self.assertRaises(ValueError):
+                jpeg.read_header(data)
+
+
+class MetadataTests(SimpleTestCase):
+    def test_exif_in_both_byte_orders(self):
+        for order in '<>':
+            with self.subTest(order=order):
+                meta = metadata.extract(with_segments(jpeg_bytes(), segment(0xE1, metadata.EXIF_HEADER + tiff(order))))
+                self.assertTrue(meta['exists'])
+                self.assertEqual(meta['count'], 4)
+                self.assertEqual(meta['tags']['Make'], 'Nik')
+                self.assertEqual(meta['software_used'], 'Adobe Photoshop 25.0')
+                self.assertEqual(meta['creation_date'], '2024:01:02 03:04:05')
+                self.assertEqual(meta['editor_traces'], ['Software: Adobe Photoshop 25.0'])
+
+    def test_xmp_history_photoshop_resources_and_comment(self):
+        xmp = (b'<x:xmpmeta xmp:CreatorTool="Canon EOS"><stEvt:softwareAgent>GIMP 2.10</stEvt:softwareAgent>'
+               b'<stEvt:softwareAgent>GIMP 2.10</stEvt:softwareAgent></x:xmpmeta>')
+        data = with_segments(
+            jpeg_bytes(),
+            segment(0xE1, metadata.XMP_HEADER + xmp),
+            segment(0xED, metadata.PHOTOSHOP_HEADER + bytes(8)),
+            segment(0xFE, b'Created with Pixlr'),
+        )
+        meta = metadata.extract(data)
+        self.assertFalse(meta['exists'])
+        self.assertEqual(meta['sources'], ['xmp', 'photoshop', 'comment'])
+        self.assertEqual(meta['tags']['CreatorTool'], 'Canon EOS')
+        self.assertEqual(meta['editor_traces'], [
+            'XMP history: GIMP 2.10', 'Comment: Created with Pixlr', 'Photoshop image resources (APP13)'])
+
+    def test_png_text_chunks_and_exif(self):
+        info = PngImagePlugin.PngInfo()
+        info.add_text('Software', 'Paint.NET 5.0')
+        info.add_text('Creation Time', '2024:05:06 07:08:09', zip=True)
+        info.add_itxt('XML:com.adobe.xmp', '<stEvt:softwareAgent>Canva</stEvt:softwareAgent>', zip=True)
+        out = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(out, 'PNG', pnginfo=info, exif=tiff('<')[:8] + bytes(6))
+        meta = metadata.extract(out.getvalue())
+        self.assertCountEqual(meta['sources'], ['exif', 'png_text', 'xmp'])
+        self.assertEqual(meta['software_used'], 'Paint.NET 5.0')
+        self.assertEqual(meta['creation_date'], '2024:05:06 07:08:09')
+        self.assertEqual(meta['editor_traces'], ['Software: Paint.NET 5.0', 'XMP history: Canva'])
+
+    def test_reading_stops_at_the_image_data(self):
+        exif = segment(0xE1, metadata.EXIF_HEADER + tiff('<'))
+        self.assertFalse(metadata.extract(jpeg_bytes() + exif)['exists'])
+
+        out = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(out, 'PNG')
+        iend = out.getvalue().rindex(b'IEND') - 4
+        data = out.getvalue()[:iend] + png_chunk(b'tEXt', b'Software\x00GIMP') + out.getvalue()[iend:]
+        self.assertEqual(metadata.extract(data)['sources'], [])
+
+    def test_truncated_and_malformed_segments_are_ignored(self):
+        full = tiff('>')
+        broken = {
+            'cut tiff': full[:30],
+            'bad byte order': b'XX' + full[2:],
+            'ifd past the end': full[:4] + struct.pack('>I', 4096) + full[8:],
+            'value past the end': full[:len(full) - 40],
+        }
+        for name, block in broken.items():
+            with self.subTest(name):
+                meta = metadata.extract(with_segments(jpeg_bytes(), segment(0xE1, metadata.EXIF_HEADER + block)))
+                self.assertEqual(meta['software_used'], 'None')
+
+        # An EXIF IFD pointer back at IFD0 is followed once, not forever
+        looped = metadata.extract(with_segments(
+            jpeg_bytes(), segment(0xE1, metadata.EXIF_HEADER + full[:42] + struct.pack('>I', 8) + full[46:])))
+        self.assertEqual((looped['count'], looped['software_used'], looped['creation_date']),
+                         (3, 'Adobe Photoshop 25.0', 'None'))
+
+        # A file cut inside its EXIF keeps the entries that are complete
+        cut = with_segments(jpeg_bytes(), segment(0xE1, metadata.EXIF_HEADER + full))[:40]
+        self.assertEqual(metadata.extract(cut)['tags'], {'Make': 'Nik'})
+        self.assertEqual(metadata.extract(b'\xff\xd8\x00garbage')['sources'], [])
+        bad_ztxt = b'\x89PNG\r\n\x1a\n' + png_chunk(b'zTXt', b'Software\x00\x00not zlib')
+        self.assertEqual(metadata.extract(bad_ztxt)['tags'], {})
+
+
+class ContextTests(SimpleTestCase):
+    def test_mapped_upload_is_read_without_a_heap_copy(self):
+        data = benchmarks.encode_jpeg(benchmarks.make_id_card(0, 2000, 1260))
+        AnalysisContext(data).header  # PIL imports its format plugins on first use
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as f:
+            f.write(data)
+            f.flush()
+            with map_file(f.name) as buffer:
+                ctx = AnalysisContext(buffer)
+                tracemalloc.start()
+                try:
+                    header = ctx.header
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                self.assertEqual((header.format, header.size), ('JPEG', (2000, 1260)))
+                self.assertLess(peak, len(data) // 4)
+                self.assertEqual(ctx.pil.size, (2000, 1260))
+                ctx.release()
+                del header
+            self.assertTrue(buffer.closed)
+
+
+class CopyMoveTests(SimpleTestCase):
+    def test_clean_document_with_text_is_not_flagged(self):
+        for seed in range(3):
+            card = cv2.cvtColor(benchmarks.make_id_card(seed, 1000, 630), cv2.COLOR_BGR2GRAY)
+            result = copy_move.detect(card, 2_560_000)
+            self.assertFalse(result['has_copy_move'], result['regions'])
+
+    def test_repeated_text_lines_are_not_flagged(self):
+        result = copy_move.detect(text_page(), 2_560_000)
+        self.assertFalse(result['has_copy_move'], result['regions'])
+
+    def test_cloned_region_is_found(self):
+        width, height = benchmarks.RESOLUTIONS['medium']
+        forged = benchmarks.tamper(benchmarks.make_id_card(0, width, height), 'copy_move', 0)
+        result = copy_move.detect(cv2.cvtColor(forged, cv2.COLOR_BGR2GRAY), 2_560_000)
+        self.assertTrue(result['has_copy_move'])
+        source, target = result['regions'][0]['source'], result['regions'][0]['target']
+        # The photo block is cloned over the text block (see benchmarks.tamper)
+        self.assertLess(source[0], width * 0.2)
+        self.assertGreater(target[0], width * 0.5)
+
+    def test_model_feature_estimates_the_native_keypoint_count(self):
+        # The classifier was trained on an uncapped full-resolution SIFT count
+        card = cv2.cvtColor(benchmarks.make_id_card(0, 1000, 630), cv2.COLOR_BGR2GRAY)
+        native = len(cv2.SIFT_create().detect(card, None))
+        result = copy_move.detect(card, 250_000)
+        self.assertLess(result['working_scale'], 1.0)
+        self.assertAlmostEqual(result['model_keypoints'] / native, 1, delta=0.25)
+
+        with override_settings(DETECTION_COPY_MOVE_NATIVE_KEYPOINTS=True):
+            self.assertEqual(copy_move.detect(card, 250_000)['model_keypoints'], native)
+
+
+class OcrPoolTests(SimpleTestCase):
+    def test_failed_engine_init_does_not_use_up_the_pool(self):
+        constructor = mock.Mock(side_effect=[RuntimeError("no tessdata"), RuntimeError("no tessdata"), 'api'])
+        fake = SimpleNamespace(PyTessBaseAPI=constructor, PSM=SimpleNamespace(SINGLE_LINE=7))
+        engine = ocr.TesserocrEngine(1, timeout=0.05)
+        with mock.patch.object(ocr, 'tesserocr', fake):
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    engine._acquire()
+            self.assertEqual(engine._acquire(), 'api')
+            # The one engine is busy: waiting ends in an error instead of blocking the check thread
+            with self.assertRaises(TimeoutError):
+                engine._acquire()
+
+
+class VerdictTests(SimpleTestCase):
+    def test_model_override_never_raises_the_score(self):
+        base = np.array([62.0, 95.0, 40.0])
+        labels = np.array([feature_store.TAMPERED_LABEL] * 3)
+        confidence, authentic = feature_store.verdicts(base, labels, np.array([0.9, 0.85, 0.95]))
+        self.assertEqual(confidence.tolist(), [62.0, 85.0, 40.0])
+        self.assertEqual(authentic.tolist(), [True, True, False])
+
+
+class HistoryTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user('reviewer')
+        self.rows = [
+            UploadHistory.objects.create(user=self.user, image='uploads/x.jpg', result='Original', confidence=90)
+            for _ in range(5)
+        ]
+        # Equal timestamps: the cursor has to fall back to the id to stay stable
+        UploadHistory.objects.filter(pk__in=[r.pk for r in self.rows[1:4]]).update(timestamp=timezone.now())
+
+    def get(self, view, query, **kwargs):
+        return view(self.factory.get('/history/', query, **kwargs.pop('headers', {})), **kwargs)
+
+    def test_cursor_visits_every_row_once_newest_first(self):
+        seen, query = [], {'user_id': self.user.pk, 'limit': 2}
+        while True:
+            page = json.loads(self.get(HistoryView.as_view(), query).content)
+            seen += [row['id'] for row in page['results']]
+            if not page['next_cursor']:
+                break
+            query['cursor'] = page['next_cursor']
+        expected = list(UploadHistory.objects.filter(user=self.user).order_by('-timestamp', '-id')
+                        .values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_is_a_400(self):
+        response = self.get(HistoryView.as_view(), {'user_id': self.user.pk, 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_numeric_user_id_is_a_json_400(self):
+        views = [
+            (HistoryView.as_view(), {}),
+            (HistoryDetailView.as_view(), {'pk': self.rows[0].pk}),
+            (async_to_sync(AsyncHistoryView.as_view()), {}),
+        ]
+        for view, kwargs in views:
+            response = self.get(view, {'user_id': 'abc'}, **kwargs)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', json.loads(response.content))
+
+    def test_etag_answers_not_modified_until_history_changes(self):
+        query = {'user_id': self.user.pk}
+        etag = self.get(HistoryView.as_view(), query)['ETag']
+        cached = self.get(HistoryView.as_view(), query, headers={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(cached.status_code, 304)
+
+        UploadHistory.objects.create(user=self.user, image='uploads/y.jpg', result='Tampered', confidence=10)
+        fresh = self.get(HistoryView.as_view(), query, headers={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], etag)
+
+
+class RescoreTests(TestCase):
+    def test_rows_without_features_are_reported(self):
+        user = User.objects.create_user('rescorer')
+        checks = {
+            'exif_metadata': {'exists': True}, 'error_level_analysis': {'difference_mean': 3.0},
+            'copy_move_detection': {'model_keypoints': 1500}, 'noise_analysis': {'std_dev': 4.0},
+            'edge_analysis': {'inconsistent_edges': False},
+        }
+        scored = {'is_authentic': True, 'confidence': 90, 'checks': checks}
+        clear_cut = {'is_authentic': True, 'confidence': 100, 'checks': dict(
+            {name: check for name, check in checks.items() if name != 'copy_move_detection'},
+            keypoint_count={'model_keypoints': 1500})}
+        legacy = {'is_authentic': True, 'confidence': 100, 'checks': {'exif_metadata': {'exists': True}}}
+        for results in (scored, clear_cut, legacy):
+            UploadHistory.from_results(user, 'uploads/x.jpg', results).save()
+
+        out = io.StringIO()
+        call_command('rescore_history', '--dry-run', stdout=out)
+        self.assertIn("Would re-score 2 records", out.getvalue())
+        self.assertIn("Skipped 1 records without stored features", out.getvalue())
+
+    def test_uploads_that_skip_tier_2_store_every_feature(self):
+        card = benchmarks.encode_jpeg(benchmarks.make_id_card(0, 1000, 630))
+        results = UploadView().detect_tampering(AnalysisContext(card, name='card.jpg'), 'fast')
+        self.assertIn('copy_move_detection', results['skipped_checks'])
+        self.assertGreater(results['checks']['keypoint_count']['model_keypoints'], 0)
+
+        record = UploadHistory.from_results(User.objects.create_user('fast'), 'uploads/card.jpg', results)
+        features = feature_store.decode([record.features])[0]
+        self.assertEqual(features[2], results['checks']['keypoint_count']['model_keypoints'])
+        self.assertEqual(record.base_confidence, results['confidence'])
+
+
+class ScanTests(SimpleTestCase):
+    def test_pipeline_failure_is_an_error_not_a_verdict(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(f'{root}/broken.jpg', 'wb') as f:
+                f.write(b'\xff\xd8 not really a jpeg')
+            record = scan_file(root, 'broken.jpg', 'standard', 'first', False)
+        self.assertEqual(record['status'], 'error')
+        self.assertTrue(record['error'])
+
+
+class SimilarUploadTests(TestCase):
+    PHOTO, TEMPLATE = 0x0123456789ABCDEF, 0xFEDCBA9876543210
+
+    def results(self, photo=None, template=TEMPLATE):
+        hashes = {ImageHash.GLOBAL: f'{template:016x}', ImageHash.FACE: photo and f'{photo:016x}'}
+        return {'is_authentic': True, 'confidence': 90, 'checks': {'perceptual_hash': hashes}}
+
+    def upload(self, user, results):
+        history = UploadHistory.from_results(user, 'uploads/x.jpg', results)
+        history.save()
+        phash.index([history])
+        return history
+
+    def setUp(self):
+        self.owner, self.other = User.objects.create_user('owner'), User.objects.create_user('other')
+        self.history = self.upload(self.owner, self.results(self.PHOTO))
+
+    def test_reused_photo_is_found_across_accounts_without_their_details(self):
+        again = self.results(self.PHOTO ^ 0b101, template=self.TEMPLATE ^ (0xFF << 40))
+        own = phash.similar(again, self.owner.pk)
+        self.assertEqual(own, [{'kind': ImageHash.FACE, 'distance': 2, 'result': 'Original', 'own_upload': True,
+                                'history_id': self.history.pk, 'timestamp': self.history.timestamp.isoformat()}])
+        for user_id in (self.other.pk, None):
+            self.assertEqual(phash.similar(again, user_id),
+                             [{'kind': ImageHash.FACE, 'distance': 2, 'result': 'Original', 'own_upload': False}])
+
+    def test_whole_page_matches_need_the_tighter_radius_and_rank_after_photos(self):
+        page = self.upload(self.other, self.results(template=self.TEMPLATE ^ 0b1))
+        self.assertEqual([m['kind'] for m in phash.similar(self.results(self.PHOTO), self.owner.pk)],
+                         [ImageHash.FACE, ImageHash.GLOBAL])
+        self.assertEqual(phash.similar(self.results(template=self.TEMPLATE ^ 0b1110), None), [])
+        self.assertEqual(page.hashes.get().kind, ImageHash.GLOBAL)  # a page without a face is still indexed
+
+    @override_settings(DETECTION_PHASH_CANDIDATES=1)
+    def test_capped_lookup_keeps_the_newest_candidate(self):
+        newest = self.upload(self.other, self.results(self.PHOTO))
+        for _ in range(3):
+            matches = phash.similar(self.results(self.PHOTO), self.other.pk)
+            self.assertEqual([m.get('history_id') for m in matches], [newest.pk])
+
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user('submitter')
+
+    def test_pipeline_failure_is_retried_then_failed_without_a_verdict(self):
+        job = jobs.enqueue(self.user, 'broken.jpg', 'image/jpeg', b'\xff\xd8\xff not really a jpeg')
+        for attempt in range(1, job.max_attempts + 1):
+            AnalysisJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+            claimed = jobs.claim_next()
+            self.assertEqual((claimed.pk, claimed.attempts), (job.pk, attempt))
+            with self.assertLogs('detection.jobs', 'ERROR'):
+                jobs.run_job(claimed)
+            claimed.refresh_from_db()
+            expected = AnalysisJob.FAILED if attempt == job.max_attempts else AnalysisJob.QUEUED
+            self.assertEqual(claimed.status, expected)
+            self.assertTrue(claimed.error)
+        self.assertIsNone(claimed.history_id)
+        self.assertFalse(UploadHistory.objects.exists())
+
+
+@override_settings(DATA_UPLOAD_MAX_NUMBER_FILES=4)
+class BatchUploadTests(TestCase):
+    def post(self, count):
+        files = [SimpleUploadedFile(f'{i}.jpg', jpeg_bytes(), 'image/jpeg') for i in range(count)]
+        request = RequestFactory().post('/api/upload/batch/', {'files': files})
+        request.user = AnonymousUser()
+        return BatchUploadView.as_view()(request)
+
+    @mock.patch.object(views, 'BATCH_MAX_FILES', 2)
+    def test_files_past_the_limit_are_reported(self):
+        lines = [json.loads(line) for line in b''.join(self.post(3).streaming_content).splitlines()]
+        self.assertEqual(sorted(line['file_name'] for line in lines), ['0.jpg', '1.jpg', '2.jpg'])
+        skipped = [line for line in lines if 'error' in line]
+        self.assertEqual([line['file_name'] for line in skipped], ['2.jpg'])
+        self.assertIn("limited to 2 files", skipped[0]['error'])
+
+    def test_more_files_than_django_accepts_is_a_json_400(self):
+        response = self.post(5)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("archive", json.loads(response.content)['error'])
+
+
+class UploadAdmissionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('token-client')
+        self.controller = admission.AdmissionController(4, per_user=1)
+        self.enterContext(mock.patch.object(admission, 'get_controller', lambda: self.controller))
+
+    def post(self, view, token):
+        image = SimpleUploadedFile('card.jpg', jpeg_bytes(), 'image/jpeg')
+        request = RequestFactory().post('/api/upload/', {'image': image}, HTTP_AUTHORIZATION=f'Bearer {token}')
+        request.user = AnonymousUser()
+        return view(request)
+
+    def test_bearer_token_clients_get_the_per_user_cap(self):
+        token = AccessToken.for_user(self.user)
+        self.controller.acquire(1, self.user.pk)  # one analysis of theirs already running
+        for view in (UploadView.as_view(), async_to_sync(AsyncUploadView.as_view())):
+            response = self.post(view, token)
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+
+    def test_invalid_token_is_a_401(self):
+        self.assertEqual(self.post(UploadView.as_view(), 'not-a-token').status_code, 401)
@@ -1,9 +1,18 @@
 from django.urls import path
-from detection.views import RegisterView, LoginView, UploadView, HistoryView
+from detection.views import RegisterView, LoginView, UploadView, HistoryView, HistoryDetailView, JobSubmitView, JobStatusView, CacheStatsView, AdmissionStatsView, BatchUploadView, AsyncUploadView, AsyncHistoryView, AsyncHistoryDetailView
 
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
     path("login/", LoginView.as_view(), name="login"),
     path("upload/", UploadView.as_view(), name="upload"),
+    path("upload/queue/", AdmissionStatsView.as_view(), name="upload-queue"),
+    path("upload/batch/", BatchUploadView.as_view(), name="upload-batch"),
     path("history/", HistoryView.as_view(), name="history"),
+    path("history/<int:pk>/", HistoryDetailView.as_view(), name="history-detail"),
+    path("async/upload/", AsyncUploadView.as_view(), name="async-upload"),
+    path("async/history/", AsyncHistoryView.as_view(), name="async-history"),
+    path("async/history/<int:pk>/", AsyncHistoryDetailView.as_view(), name="async-history-detail"),
+    path("jobs/", JobSubmitView.as_view(), name="job-submit"),
+    path("jobs/<uuid:job_id>/", JobStatusView.as_view(), name="job-status"),
+    path("cache/stats/", CacheStatsView.as_view(), name="cache-stats"),
 ]
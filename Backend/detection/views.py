@@ -1,31 +1,56 @@
+import base64
+import hashlib
 import os
-import tempfile
 import mimetypes
 from pathlib import Path
 from datetime import datetime
 import json
-
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+import zipfile
+from concurrent import futures
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import TooManyFilesSent
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.middleware.csrf import get_token
 from django.utils.decorators import method_decorator
+from django.db.models import Count, Max, Q
+from django.urls import reverse
 from django.views import View
-
-import numpy as np
-import cv2
-from PIL import Image
-from PyPDF2 import PdfReader, PdfWriter
-from pdf2image import convert_from_bytes
-import pytesseract
-import exifread
-import joblib
-
-from detection.models import UploadHistory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from asgiref.sync import sync_to_async
+
+from detection import admission, feature_store, metadata, metrics, resolution
+from detection.admission import AdmissionRejected
+from detection.lazy import LazyModule
+from detection.ingest import PDF_DPI, UploadError, decrypt_pdf, open_pdf, render_page, select_pages, upload_buffer
+from detection.executor import analyze_in_process, document_workers, get_document_pool, run_checks
+from detection import jobs
+from detection.cache import result_cache
+from detection.models import AnalysisJob, UploadHistory
+from detection.registry import model_registry
+
+# The forensic stack loads on first use (or in warmup.warm_up()), not when URLs are loaded
+np = LazyModule('numpy')
+cv2 = LazyModule('cv2')
+context = LazyModule('detection.context')
+copy_move = LazyModule('detection.copy_move')
+ela = LazyModule('detection.ela')
+jpeg = LazyModule('detection.jpeg')
+localization = LazyModule('detection.localization')
+ocr = LazyModule('detection.ocr')
+phash = LazyModule('detection.phash')
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-MODEL_PATH = os.path.join(BASE_DIR, "detection", "model", "id_classifier.pkl")
 # @method_decorator(csrf_exempt, name='dispatch')
 # class RegisterView(View):
 #     def post(self, request):
@@ -68,8 +93,76 @@ MODEL_PATH = os.path.join(BASE_DIR, "detection", "model", "id_classifier.pkl")
 #             })
 #         return JsonResponse({"error": "Invalid credentials."}, status=401)
 
+ALLOWED_TYPES = ['image/jpeg', 'image/png', 'application/pdf']
+BATCH_MAX_FILES = getattr(settings, 'DETECTION_BATCH_MAX_FILES', 500)
+BATCH_MAX_FILE_SIZE = getattr(settings, 'DETECTION_BATCH_MAX_FILE_SIZE', 20 * 1024 * 1024)
+BATCH_HISTORY_CHUNK = 50
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def upload_user(request):
+    """The uploader: the session's user, else the one an ``Authorization: Bearer`` token names.
+
+    JWTMiddleware only guards /api/auth/history, so token clients would reach
+    the upload views anonymous, escaping the per-user admission cap and
+    history. Sets request.user; a bad token raises InvalidToken or
+    AuthenticationFailed.
+    """
+    if not request.user.is_authenticated:
+        authenticated = JWTAuthentication().authenticate(request)
+        if authenticated is not None:
+            request.user, request.auth = authenticated
+    return request.user
+
+
+def result_payload(results, file_name, similar_uploads=()):
+    return {
+        "status": "Original" if results['is_authentic'] else "Tampered",
+        "confidence": results['confidence'],
+        "details": results,
+        "similar_uploads": list(similar_uploads),
+        "timestamp": datetime.now().isoformat(),
+        "file_name": file_name
+    }
+
+
+def busy_response(rejection):
+    response = JsonResponse({"error": str(rejection)}, status=rejection.status)
+    response["Retry-After"] = str(rejection.retry_after)
+    return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class UploadView(View):
+    # result name -> (method, result reported when the check times out)
+    CHECKS = {
+        'error_level_analysis': ('error_level_analysis', {'tamper_indication': False}),
+        'copy_move_detection': ('detect_copy_move', {'has_copy_move': False}),
+        'text_analysis': ('check_text_consistency', {'inconsistencies': False}),
+        'noise_analysis': ('analyze_noise_patterns', {'inconsistent_noise': False}),
+        'compression_analysis': ('check_compression', {'multiple_compression': False}),
+        'edge_analysis': ('check_edge_consistency', {'inconsistent_edges': False}),
+        'perceptual_hash': ('compute_perceptual_hash', {}),
+        'keypoint_count': ('count_keypoints', {}),
+    }
+    # Cheap pixel statistics first; OCR, SIFT matching and the model only when
+    # the cheap evidence leaves the verdict open
+    TIERS = (
+        ('error_level_analysis', 'noise_analysis', 'compression_analysis', 'edge_analysis', 'perceptual_hash'),
+        ('copy_move_detection', 'text_analysis'),
+    )
+    TIER_2_MAX_PENALTY = 25  # copy-move + text
+    VERDICT_THRESHOLD = feature_store.VERDICT_THRESHOLD
+    MODES = ('fast', 'standard', 'thorough')
+
+    @classmethod
+    def resolve_mode(cls, mode):
+        mode = (mode or getattr(settings, 'DETECTION_DEFAULT_MODE', 'standard')).strip().lower()
+        if mode not in cls.MODES:
+            raise UploadError(f"mode must be one of: {', '.join(cls.MODES)}.")
+        return mode
+
     def post(self, request):
         if 'image' not in request.FILES:
             return JsonResponse({"error": "File is missing."}, status=400)
@@ -77,289 +170,804 @@ class UploadView(View):
         uploaded_file = request.FILES['image']
         password = request.POST.get("password", "").strip()
 
-        allowed_types = ['image/jpeg', 'image/png', 'application/pdf']
-        if uploaded_file.content_type not in allowed_types:
+        if uploaded_file.content_type not in ALLOWED_TYPES:
             return JsonResponse({"error": "Unsupported file type."}, status=400)
 
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[-1]) as tmp_file:
-                for chunk in uploaded_file.chunks():
-                    tmp_file.write(chunk)
-                tmp_path = tmp_file.name
+            user = upload_user(request)
+        except (InvalidToken, AuthenticationFailed) as e:
+            return JsonResponse({"error": str(e)}, status=401)
 
-            if uploaded_file.content_type == 'application/pdf':
-                with open(tmp_path, 'rb') as f:
-                    reader = PdfReader(f)
-                    if reader.is_encrypted:
-                        if not password:
-                            return JsonResponse({"error": "PDF is password protected."}, status=400)
-                        reader.decrypt(password)
-                        writer = PdfWriter()
-                        for page in reader.pages:
-                            writer.add_page(page)
-                        decrypted_path = tmp_path + "_decrypted.pdf"
-                        with open(decrypted_path, 'wb') as f:
-                            writer.write(f)
-                        os.unlink(tmp_path)
-                        tmp_path = decrypted_path
-
-                images = convert_from_bytes(open(tmp_path, 'rb').read())
-                if not images:
-                    return JsonResponse({"error": "Could not convert PDF to image."}, status=400)
-
-                img_path = tmp_path + ".jpg"
-                images[0].save(img_path, 'JPEG')
-                os.unlink(tmp_path)
-                tmp_path = img_path
-
-            results = self.detect_tampering(tmp_path)
-
-            if request.user.is_authenticated:
-                UploadHistory.objects.create(
-                    user=request.user,
-                    image=uploaded_file,
-                    result="Original" if results['is_authentic'] else "Tampered",
-                    confidence=results['confidence'],
-                    detection_details=results
-                )
-
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+        timings = request.GET.get("timings") == "1"
+        trace = metrics.start_trace(force=timings)
+        metrics.uploads.inc(content_type=uploaded_file.content_type)
 
-            return JsonResponse({
-                "status": "Original" if results['is_authentic'] else "Tampered",
-                "confidence": results['confidence'],
-                "details": results,
-                "timestamp": datetime.now().isoformat(),
-                "file_name": uploaded_file.name
-            })
+        try:
+            mode = self.resolve_mode(request.POST.get("mode"))
+            pages = request.POST.get("pages")
+            weight = admission.request_weight(uploaded_file.size, uploaded_file.content_type, pages)
+            user_id = user.pk if user.is_authenticated else None
+            with admission.admit(weight, user_id, trace), upload_buffer(uploaded_file) as data:
+                with trace.span('analysis'):
+                    results = self.analyze_bytes(data, uploaded_file.content_type, uploaded_file.name, password,
+                                                 pages=pages, trace=trace, mode=mode)
+
+            with trace.span('similarity'):
+                similar = phash.similar(results, user_id)
+            if user.is_authenticated:
+                with trace.span('db_write'):
+                    history = UploadHistory.from_results(user, uploaded_file, results)
+                    history.save()
+                    phash.index([history])
+
+            payload = result_payload(results, uploaded_file.name, similar)
+            if timings:
+                payload["timings"] = trace.as_list()
+            return JsonResponse(payload)
+
+        except AdmissionRejected as e:
+            return busy_response(e)
+
+        except UploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
-        
-        finally:
-            if 'tmp_path' in locals() and tmp_path and os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+
+    def analyze_file(self, path, content_type, password='', pages=None, trace=None, mode=None):
+        with open(path, 'rb') as f:
+            return self.analyze_bytes(f.read(), content_type, os.path.basename(path), password, pages, trace, mode)
+
+    def analyze_bytes(self, data, content_type, name, password='', pages=None, trace=None, mode=None):
+        mode = self.resolve_mode(mode)
+        if content_type == 'application/pdf':
+            return self.analyze_pdf(data, name, password, pages, trace, mode)
+
+        key = result_cache.key(data, mode=mode)
+        results = result_cache.get(key)
+        if results is None:
+            results = self.detect_tampering(context.AnalysisContext(data, name=name, trace=trace), mode)
+            if not results.get('error'):  # a failed run is retried, not served again
+                result_cache.set(key, results)
+        return results
+
+    def analyze_pdf(self, data, name, password='', pages=None, trace=None, mode=None):
+        mode = self.resolve_mode(mode)
+        reader = open_pdf(data, password)
+        selected = select_pages(pages, len(reader.pages))
+        dpi = getattr(settings, 'DETECTION_PDF_DPI', PDF_DPI)
+
+        key = result_cache.key(data, pages=','.join(map(str, selected)), dpi=dpi, mode=mode)
+        results = result_cache.get(key)
+        if results is not None:
+            return results
+
+        trace = trace or metrics.NULL_TRACE
+        unlocked = decrypt_pdf(data, reader=reader)
+
+        def analyze_page(page):
+            with trace.span('pdf_render', page=page):
+                image = render_page(unlocked, page, dpi)
+            page_results = self.detect_tampering(
+                context.AnalysisContext(image, name=f"{name}.page{page}.jpg", trace=trace, rendered=True), mode
+            )
+            page_results['page'] = page
+            return page_results
+
+        if len(selected) == 1:
+            results = analyze_page(selected[0])
+        else:
+            # Pages render (pdftoppm) and analyze independently; report the worst one on top
+            page_results = list(get_document_pool().map(analyze_page, selected))
+            results = dict(min(page_results, key=lambda r: r['confidence']))
+            results['is_authentic'] = all(r['is_authentic'] for r in page_results)
+            results['pages'] = page_results
+
+        if not results.get('error'):
+            result_cache.set(key, results)
+        return results
 
     # === ALL detection functions below ===
 
-    def detect_tampering(self, image_path):
+    def detect_tampering(self, ctx, mode=None):
+        if not isinstance(ctx, context.AnalysisContext):
+            ctx = context.AnalysisContext.from_path(ctx)
+        mode = self.resolve_mode(mode)
+
         results = {
             'is_authentic': True,
             'confidence': 100.0,
             'checks': {},
-            'reasons': []
+            'reasons': [],
+            'mode': mode,
+            'skipped_checks': [],
         }
 
         try:
-            # 1. Basic image props
-            img = Image.open(image_path)
-            results['checks']['image_properties'] = {
-                'width': img.width,
-                'height': img.height,
-                'format': img.format,
-                'mode': img.mode
-            }
-
-            # 2. EXIF Metadata
-            with open(image_path, 'rb') as f:
-                tags = exifread.process_file(f, stop_tag='UNDEF', details=False)
-            has_exif = bool(tags)
-            results['checks']['exif_metadata'] = {
-                'exists': has_exif,
-                'count': len(tags),
-                'software_used': str(tags.get('Software', 'None')),
-                'creation_date': str(tags.get('DateTimeOriginal', 'None'))
-            }
+            with ctx.trace.span('metadata'):
+                # 1. Basic image props
+                img = ctx.header
+                results['checks']['image_properties'] = {
+                    'width': img.width,
+                    'height': img.height,
+                    'format': img.format,
+                    'mode': img.mode
+                }
+
+                # 2. EXIF / XMP / PNG text metadata, from the leading segments only
+                meta = metadata.extract(ctx.data)
+                has_exif = meta['exists']
+                results['checks']['exif_metadata'] = meta
 
             if not has_exif:
                 results['reasons'].append("Missing EXIF metadata (may be expected for government PDFs)")
                 # Don't reduce confidence much for Aadhaar
+            if meta['editor_traces']:
+                results['confidence'] -= 5
+                results['reasons'].append(f"Edited with image software ({meta['editor_traces'][0]})")
+
+            # 3-8. Forensic checks in tiers: pixel statistics first, OCR/SIFT/ML only
+            # when they could still change the verdict (or always, in thorough mode)
+            tier_1, tier_2 = self.TIERS
+            if mode == 'thorough':
+                checks = self.run_tier(ctx, tier_1 + tier_2, results)
+            else:
+                # Tier 2 may not run, and every upload stores the model's features
+                checks = self.run_tier(ctx, tier_1 + ('keypoint_count',), results)
 
             # 3. ELA
-            ela = self.error_level_analysis(image_path)
-            results['checks']['error_level_analysis'] = ela
-            if ela['tamper_indication'] and ela['difference_mean'] > 20:
+            ela_result = checks['error_level_analysis']
+            if ela_result['tamper_indication'] and ela_result['difference_mean'] > 20:
                 results['confidence'] -= 10
                 results['reasons'].append("High ELA difference indicates possible tampering")
 
-            # 4. Copy-move
-            copy_move = self.detect_copy_move(image_path)
-            results['checks']['copy_move_detection'] = copy_move
-            if copy_move['has_copy_move'] and copy_move['keypoints'] > 1200:
-                results['confidence'] -= 15
-                results['reasons'].append("Potential copy-move forgery (many keypoints matched)")
-
-            # 5. Text check
-            text_check = self.check_text_consistency(image_path)
-            results['checks']['text_analysis'] = text_check
-            if text_check['inconsistencies']:
-                results['confidence'] -= 10
-                results['reasons'].append("Text inconsistencies detected")
-
             # 6. Noise analysis
-            noise = self.analyze_noise_patterns(image_path)
-            results['checks']['noise_analysis'] = noise
-            if noise['std_dev'] > 25:
+            noise = checks['noise_analysis']
+            if noise.get('std_dev', 0) > 25:
                 results['confidence'] -= 5
                 results['reasons'].append("Unusual noise pattern")
 
             # 7. Compression
-            compression = self.check_compression(image_path)
-            results['checks']['compression_analysis'] = compression
             # No penalty if multiple compression is found — expected in downloads
+            compression = checks['compression_analysis']
+            if compression.get('double_quantization'):
+                results['reasons'].append(
+                    f"JPEG was compressed twice (first at quality ~{compression['primary_quality']})")
+            if compression.get('signature_kind') == 'editor':
+                results['reasons'].append(f"Quantization tables match {compression['signature']}")
 
             # 8. Edge consistency
-            edges = self.check_edge_consistency(image_path)
-            results['checks']['edge_analysis'] = edges
+            edges = checks['edge_analysis']
             if edges['inconsistent_edges']:
                 results['confidence'] -= 5
                 results['reasons'].append("Irregular edge patterns detected")
-            
-            # Feature vector for classification
-            features = [
-                1 if has_exif else 0,
-                ela.get('difference_mean', 0),
-                copy_move.get('keypoints', 0),
-                noise.get('std_dev', 0),
-                1 if edges.get('inconsistent_edges') else 0,
-            ]
 
-            label, prob = self.classify_with_model(features)
-
-            results['checks']['ml_classification'] = {
-                'label': ['Aadhaar', 'PAN', 'Tampered'][label],
-                'confidence': round(float(prob)*100, 2)
-            }
-
-            # If ML thinks it's tampered → override
-            if label == 2 and prob > 0.8:
-                results['is_authentic'] = False
-                results['confidence'] = round(float(prob)*100, 2)
-                results['reasons'].append("ML model classified as tampered")
+            if mode == 'standard' and self.is_ambiguous(results['confidence'], checks):
+                checks.update(self.run_tier(ctx, tier_2, results))
+
+            if 'copy_move_detection' not in checks:
+                # Tier 2 skipped; a clear-cut verdict needs no model override, so the model is skipped too
+                results['skipped_checks'] = list(tier_2) + ['ml_classification']
+            else:
+                # 4. Copy-move
+                copy_move_result = checks['copy_move_detection']
+                if copy_move_result['has_copy_move']:
+                    results['confidence'] -= 15
+                    results['reasons'].append("Potential copy-move forgery (duplicated regions matched)")
+
+                # 5. Text check
+                text_check = checks['text_analysis']
+                if text_check['inconsistencies']:
+                    results['confidence'] -= 10
+                    results['reasons'].append("Text inconsistencies detected")
+
+                # Feature vector for classification
+                features = feature_store.from_checks(results['checks'])
+                base_confidence = round(max(0, min(100, results['confidence'])), 2)
+
+                with ctx.trace.span('ml_classification'):
+                    label, prob = self.classify_with_model(features)
+
+                results['checks']['ml_classification'] = {
+                    'label': ['Aadhaar', 'PAN', 'Tampered'][label],
+                    'confidence': round(float(prob)*100, 2),
+                    'features': [float(f) for f in features],
+                    'base_confidence': base_confidence,
+                    'model_version': model_registry.version[:16],
+                }
+
+                # If ML thinks it's tampered → override, but never raise the score
+                if label == feature_store.TAMPERED_LABEL and prob > feature_store.OVERRIDE_PROBABILITY:
+                    results['is_authentic'] = False
+                    results['confidence'] = min(results['confidence'], round(float(prob)*100, 2))
+                    results['reasons'].append("ML model classified as tampered")
 
             # Final threshold
             results['confidence'] = round(max(0, min(100, results['confidence'])), 2)
-            results['is_authentic'] = results['confidence'] >= 60
+            results['is_authentic'] = results['confidence'] >= self.VERDICT_THRESHOLD
 
         except Exception as e:
+            metrics.check_errors.inc(check='pipeline')
             results['error'] = str(e)
             results['is_authentic'] = False
             results['confidence'] = 0
             results['reasons'].append("Internal error during detection")
 
+        finally:
+            ctx.release()
+
         return results
 
-    def error_level_analysis(self, image_path, quality=90):
+    def run_tier(self, ctx, names, results):
+        """Run the named checks concurrently and record them (and any that degraded) in ``results``."""
+        checks = run_checks({
+            name: (ctx.trace.timed(name, partial(getattr(self, self.CHECKS[name][0]), ctx)), self.CHECKS[name][1])
+            for name in names
+        })
+        results['checks'].update(checks)
+        for name, check in checks.items():
+            if 'error' in check:
+                metrics.check_errors.inc(check=name)
+        degraded = [name for name, check in checks.items() if check.get('degraded')]
+        if degraded:
+            results.setdefault('degraded_checks', []).extend(degraded)
+        return checks
+
+    def is_ambiguous(self, confidence, checks):
+        """Whether tier 2 could still change the verdict after the cheap checks.
+
+        Tier 2 only lowers the score (the model override is clamped to
+        it), so a document already below the threshold stays tampered. One that passes is clear-cut only when its
+        tier-2 penalties could not sink it and no cheap check saw anything
+        suspicious, not even below its penalty threshold (the model override
+        would otherwise go unchecked).
+        """
+        if confidence < self.VERDICT_THRESHOLD:
+            return False
+        if confidence < self.VERDICT_THRESHOLD + self.TIER_2_MAX_PENALTY:
+            return True
+        ela_result, noise = checks['error_level_analysis'], checks['noise_analysis']
+        compression = checks['compression_analysis']
+        return bool(
+            ela_result.get('tamper_indication') or noise.get('inconsistent_noise')
+            or localization.has_significant_region(ela_result) or localization.has_significant_region(noise)
+            or compression.get('double_quantization') or compression.get('signature_kind') == 'editor'
+        )
+
+    def error_level_analysis(self, ctx, qualities=None):
         try:
-            original = Image.open(image_path).convert('RGB')
-            ela_path = os.path.join(tempfile.gettempdir(), 'ela_tmp.jpg')
-            original.save(ela_path, 'JPEG', quality=quality)
-
-            ela_image = cv2.absdiff(
-                cv2.imread(image_path),
-                cv2.imread(ela_path)
-            )
-            diff_mean = float(ela_image.mean())
-
-            os.unlink(ela_path)
-            return {
-                'tamper_indication': diff_mean > 10,
-                'difference_mean': diff_mean,
-                'threshold': 10
-            }
+            bgr, scale = ctx.scaled('bgr', resolution.max_pixels('error_level_analysis'))
+            result = ela.error_level_analysis(bgr, qualities, localize=localization.enabled(), scale=scale)
+            return dict(result, working_scale=round(scale, 4))
         except Exception as e:
             return {'error': str(e), 'tamper_indication': False}
 
-    def detect_copy_move(self, image_path):
+    def detect_copy_move(self, ctx):
         try:
-            img = cv2.imread(image_path)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            sift = cv2.SIFT_create()
-            kp, des = sift.detectAndCompute(gray, None)
-            return {
-                'keypoints': len(kp),
-                'has_copy_move': len(kp) > 500  # arbitrary threshold
-            }
+            return copy_move.detect(ctx.gray, resolution.max_pixels('copy_move_detection'))
         except Exception as e:
             return {'error': str(e), 'has_copy_move': False}
 
-    def check_text_consistency(self, image_path):
+    def count_keypoints(self, ctx):
+        try:
+            max_pixels = resolution.max_pixels('copy_move_detection')
+            return {'model_keypoints': copy_move.count_keypoints(ctx.gray, max_pixels)}
+        except Exception as e:
+            return {'error': str(e)}
+
+    def check_text_consistency(self, ctx):
         try:
-            text = pytesseract.image_to_string(Image.open(image_path))
-            lines = text.split('\n')
-            inconsistencies = any(len(line.strip()) < 3 for line in lines if line.strip())
+            gray, scale = ctx.scaled('gray', resolution.max_pixels('text_analysis'))
+            engine, lines = ocr.read_text(gray)
+            text_lines = [' '.join(text for text, _, _ in words) for words in lines if words]
+            words = [
+                {'text': text, 'confidence': round(conf, 1), 'box': [int(round(v / scale)) for v in box]}
+                for line in lines for text, conf, box in line
+            ]
+            inconsistencies = any(len(line.strip()) < 3 for line in text_lines)
             return {
-                'ocr_text_sample': lines[:5],
-                'inconsistencies': inconsistencies
+                'ocr_text_sample': text_lines[:5],
+                'inconsistencies': inconsistencies,
+                'engine': engine,
+                'regions': len(lines),
+                'mean_confidence': round(float(np.mean([w['confidence'] for w in words])), 1) if words else None,
+                'words': words[:ocr.MAX_WORDS],
             }
         except Exception as e:
             return {'error': str(e), 'inconsistencies': False}
 
-    def analyze_noise_patterns(self, image_path):
+    def analyze_noise_patterns(self, ctx):
         try:
-            img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            img, scale = ctx.scaled('gray', resolution.max_pixels('noise_analysis'))
             blur = cv2.GaussianBlur(img, (5, 5), 0)
             noise = cv2.absdiff(img, blur)
             std_dev = np.std(noise)
-            return {
+            result = {
                 'std_dev': float(std_dev),
-                'inconsistent_noise': std_dev > 10  # threshold
+                'inconsistent_noise': bool(std_dev > 10),  # threshold
+                'working_scale': round(scale, 4)
             }
+            if localization.enabled():
+                # Pasted regions can be noisier or smoother than the rest of the card
+                result['localization'] = localization.localize(
+                    noise, scale, min_delta=1.0, two_sided=True, keep=localization.smooth_mask(blur))
+            return result
         except Exception as e:
             return {'error': str(e), 'inconsistent_noise': False}
 
-    def check_compression(self, image_path):
+    def check_compression(self, ctx):
         try:
-            file_type = mimetypes.guess_type(image_path)[0]
-            return {
-                'format': file_type,
-                'multiple_compression': 'jpeg' in file_type
-            }
+            if not jpeg.is_jpeg(ctx.data):
+                return {'format': ctx.header.format, 'multiple_compression': False}
+            if ctx.rendered:
+                # pdftoppm's own encoding says nothing about the document
+                return {'format': 'JPEG', 'rendered': True, 'multiple_compression': False}
+            # The coefficient histograms need the file's 8x8 grid, which a rotated decode loses
+            rotated = ctx.header.getexif().get(jpeg.EXIF_ORIENTATION, 1) != 1
+            result = jpeg.analyze(ctx.data, ctx.luma if rotated else ctx.gray)
+            result['multiple_compression'] = bool(result['double_quantization'])
+            return result
         except Exception as e:
             return {'error': str(e), 'multiple_compression': False}
 
-    def check_edge_consistency(self, image_path):
+    def compute_perceptual_hash(self, ctx):
         try:
-            img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            return phash.compute(ctx.gray)
+        except Exception as e:
+            return {'error': str(e)}
+
+    def check_edge_consistency(self, ctx):
+        try:
+            img, scale = ctx.scaled('gray', resolution.max_pixels('edge_analysis'))
             edges = cv2.Canny(img, 100, 200)
-            edge_sum = np.sum(edges) / 255
+            # Edge length grows with the image side, so report it at native resolution
+            edge_sum = cv2.countNonZero(edges) / scale
             return {
                 'edge_pixel_count': int(edge_sum),
-                'inconsistent_edges': edge_sum < 1000  # threshold
+                'inconsistent_edges': bool(edge_sum < 1000),  # threshold, native pixels
+                'working_scale': round(scale, 4)
             }
         except Exception as e:
             return {'error': str(e), 'inconsistent_edges': False}
     
     def classify_with_model(self, features):
-        model = joblib.load(MODEL_PATH)
-        label = model.predict([features])[0]
-        prob = model.predict_proba([features])[0].max()
-        return label, prob
+        return model_registry.predict(features)
+
+def encode_cursor(item):
+    return base64.urlsafe_b64encode(f"{item.timestamp.isoformat()}|{item.pk}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(timestamp), int(pk)
+
+
+def etag_key(request, stats, kwargs):
+    key = (f"{request.GET.get('user_id')}:{stats['count']}:{stats['last']}:{stats['rescored']}:"
+           f"{kwargs}:{request.GET.urlencode()}")
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def history_user_id(request):
+    """The user_id query parameter as an int; None when it is missing or not a number."""
+    try:
+        return int(request.GET.get("user_id") or "")
+    except ValueError:
+        return None
+
+
+def history_etag(request, *args, **kwargs):
+    # Runs before the view: bad input gets no ETag and is rejected by the view itself
+    user_id = history_user_id(request)
+    if user_id is None:
+        return None
+    # Cheap aggregate instead of serializing rows: any insert, delete or re-scoring changes it
+    stats = UploadHistory.objects.filter(user_id=user_id).aggregate(
+        count=Count('id'), last=Max('id'), rescored=Max('rescored_at'))
+    return etag_key(request, stats, kwargs)
+
+
+async def ahistory_etag(request, *args, **kwargs):
+    user_id = history_user_id(request)
+    if user_id is None:
+        return None
+    stats = await UploadHistory.objects.filter(user_id=user_id).aaggregate(
+        count=Count('id'), last=Max('id'), rescored=Max('rescored_at'))
+    return etag_key(request, stats, kwargs)
+
+
+def serialize_history(item, detail=False):
+    data = {
+        "id": item.id,
+        "image_url": item.image.url if item.image else None,
+        "result": item.result,
+        "confidence": item.confidence,
+        "timestamp": item.timestamp.isoformat(),
+    }
+    if detail:
+        data["detection_details"] = item.detection_details
+    return data
+
+
+def history_params(request):
+    """Parse limit/cursor/detail; raises ValueError on a malformed limit or cursor."""
+    try:
+        limit = max(1, min(int(request.GET.get("limit", HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE))
+        cursor = request.GET.get("cursor")
+        cursor = decode_cursor(cursor) if cursor else None
+    except TypeError as e:
+        raise ValueError(str(e))
+    return limit, cursor, request.GET.get("detail") == "full"
+
+
+def history_queryset(user_id, cursor, detail):
+    history = UploadHistory.objects.filter(user_id=user_id).order_by('-timestamp', '-id').defer('features')
+    if not detail:
+        history = history.defer('detection_details')
+    if cursor:
+        timestamp, pk = cursor
+        history = history.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    return history
+
+
+def history_page(items, limit, detail):
+    # items holds up to limit + 1 rows; the extra one only tells whether there is a next page
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return {
+        "results": [serialize_history(item, detail) for item in items[:limit]],
+        "next_cursor": next_cursor,
+    }
+
+
+async def conditional_response(request, etag_func, view, *args, **kwargs):
+    """Async stand-in for @condition, whose ETag callable would hit the DB on the event loop."""
+    etag = await etag_func(request, *args, **kwargs)
+    etag = quote_etag(etag) if etag is not None else None
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = await view(request, *args, **kwargs)
+    if etag and request.method in ("GET", "HEAD"):
+        response.headers.setdefault("ETag", etag)
+    return response
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class HistoryView(View):
+    @method_decorator(condition(etag_func=history_etag))
     def get(self, request):
         # In production, integrate JWT middleware to ensure authentication
-        user_id = request.GET.get("user_id")
-        if not user_id:
-            return JsonResponse({"error": "user_id is required."}, status=400)
+        user_id = history_user_id(request)
+        if user_id is None:
+            return JsonResponse({"error": "A numeric user_id is required."}, status=400)
 
         try:
-            user = User.objects.get(id=user_id)
-            history = UploadHistory.objects.filter(user=user).order_by('-timestamp')
-            data = [
-                {
-                    "id": item.id,
-                    "image_url": item.image.url if item.image else None,
-                    "result": item.result,
-                    "confidence": item.confidence,
-                    "timestamp": item.timestamp.isoformat(),
-                    "detection_details": item.detection_details
-                } for item in history
-            ]
-            return JsonResponse(data, safe=False)
-        except User.DoesNotExist:
-            return JsonResponse({"error": "User not found."}, status=404)
+            limit, cursor, detail = history_params(request)
+        except ValueError:
+            return JsonResponse({"error": "Invalid limit or cursor."}, status=400)
+
+        try:
+            if not User.objects.filter(id=user_id).exists():
+                return JsonResponse({"error": "User not found."}, status=404)
+
+            items = list(history_queryset(user_id, cursor, detail)[:limit + 1])
+            return JsonResponse(history_page(items, limit, detail))
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class HistoryDetailView(View):
+    @method_decorator(condition(etag_func=history_etag))
+    def get(self, request, pk):
+        user_id = history_user_id(request)
+        if user_id is None:
+            return JsonResponse({"error": "A numeric user_id is required."}, status=400)
+
+        try:
+            item = UploadHistory.objects.get(pk=pk, user_id=user_id)
+        except UploadHistory.DoesNotExist:
+            return JsonResponse({"error": "Record not found."}, status=404)
+        return JsonResponse(serialize_history(item, detail=True))
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUploadView(View):
+    """UploadView for ASGI deployments.
+
+    The request only holds the event loop while it awaits: the body is
+    received by the ASGI handler, multipart parsing and file saving run in a
+    thread, the forensic checks run in the process pool (see
+    executor.analyze_in_process) and history goes through the async ORM.
+    """
+
+    async def post(self, request):
+        files = await sync_to_async(lambda: request.FILES)()
+        if 'image' not in files:
+            return JsonResponse({"error": "File is missing."}, status=400)
+
+        uploaded_file = files['image']
+        password = request.POST.get("password", "").strip()
+
+        if uploaded_file.content_type not in ALLOWED_TYPES:
+            return JsonResponse({"error": "Unsupported file type."}, status=400)
+
+        try:
+            user = await sync_to_async(upload_user)(request)
+        except (InvalidToken, AuthenticationFailed) as e:
+            return JsonResponse({"error": str(e)}, status=401)
+
+        timings = request.GET.get("timings") == "1"
+        trace = metrics.start_trace(force=timings)
+        metrics.uploads.inc(content_type=uploaded_file.content_type)
+
+        try:
+            if hasattr(uploaded_file, 'temporary_file_path'):
+                source = uploaded_file.temporary_file_path()
+            else:
+                uploaded_file.seek(0)
+                source = uploaded_file.read()
+
+            # Spans inside the worker process stay there; only the round trip is timed here
+            mode = UploadView.resolve_mode(request.POST.get("mode"))
+            pages = request.POST.get("pages")
+            weight = admission.request_weight(uploaded_file.size, uploaded_file.content_type, pages)
+            async with admission.aadmit(weight, user.pk if user.is_authenticated else None, trace):
+                with trace.span('analysis'):
+                    results = await analyze_in_process(source, uploaded_file.content_type, uploaded_file.name,
+                                                       password, pages, mode)
+
+            with trace.span('similarity'):
+                similar = await sync_to_async(phash.similar)(results, user.pk if user.is_authenticated else None)
+            if user.is_authenticated:
+                with trace.span('db_write'):
+                    history = UploadHistory.from_results(user, uploaded_file, results)
+                    await history.asave()
+                    await sync_to_async(phash.index)([history])
+
+            payload = result_payload(results, uploaded_file.name, similar)
+            if timings:
+                payload["timings"] = trace.as_list()
+            return JsonResponse(payload)
+
+        except AdmissionRejected as e:
+            return busy_response(e)
+
+        except UploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncHistoryView(View):
+    async def get(self, request):
+        return await conditional_response(request, ahistory_etag, self.page)
+
+    async def page(self, request):
+        user_id = history_user_id(request)
+        if user_id is None:
+            return JsonResponse({"error": "A numeric user_id is required."}, status=400)
+
+        try:
+            limit, cursor, detail = history_params(request)
+        except ValueError:
+            return JsonResponse({"error": "Invalid limit or cursor."}, status=400)
+
+        try:
+            if not await User.objects.filter(id=user_id).aexists():
+                return JsonResponse({"error": "User not found."}, status=404)
+
+            items = [item async for item in history_queryset(user_id, cursor, detail)[:limit + 1]]
+            return JsonResponse(history_page(items, limit, detail))
         except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
\ No newline at end of file
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncHistoryDetailView(View):
+    async def get(self, request, pk):
+        return await conditional_response(request, ahistory_etag, self.record, pk=pk)
+
+    async def record(self, request, pk):
+        user_id = history_user_id(request)
+        if user_id is None:
+            return JsonResponse({"error": "A numeric user_id is required."}, status=400)
+
+        try:
+            item = await UploadHistory.objects.aget(pk=pk, user_id=user_id)
+        except UploadHistory.DoesNotExist:
+            return JsonResponse({"error": "Record not found."}, status=404)
+        return JsonResponse(serialize_history(item, detail=True))
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchUploadView(View):
+    def post(self, request):
+        try:
+            files = request.FILES.getlist('files')
+        except TooManyFilesSent:
+            return JsonResponse({"error": f"Too many files; send up to {BATCH_MAX_FILES} per request, "
+                                          f"or a single 'archive' ZIP."}, status=400)
+        archive = request.FILES.get('archive')
+        if not files and archive is None:
+            return JsonResponse({"error": "Send one or more 'files' or a single 'archive' ZIP."}, status=400)
+
+        try:
+            documents = self.iter_archive(archive) if archive is not None else self.iter_files(files)
+        except zipfile.BadZipFile:
+            return JsonResponse({"error": "Archive is not a valid ZIP file."}, status=400)
+
+        try:
+            user = upload_user(request)
+        except (InvalidToken, AuthenticationFailed) as e:
+            return JsonResponse({"error": str(e)}, status=401)
+        user = user if user.is_authenticated else None
+        response = StreamingHttpResponse(self.stream(documents, user), content_type='application/x-ndjson')
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def iter_files(self, files):
+        for index, uploaded_file in enumerate(files):
+            read = (lambda f=uploaded_file: b''.join(f.chunks())) if index < BATCH_MAX_FILES else self.over_limit
+            yield uploaded_file.name, uploaded_file.content_type, read
+
+    def iter_archive(self, archive):
+        zf = zipfile.ZipFile(archive)
+        members = [info for info in zf.infolist() if not info.is_dir()]
+        return ((info.filename, mimetypes.guess_type(info.filename)[0],
+                 partial(self.read_member, zf, info) if index < BATCH_MAX_FILES else self.over_limit)
+                for index, info in enumerate(members))
+
+    def read_member(self, zf, info):
+        if info.file_size > BATCH_MAX_FILE_SIZE:
+            raise UploadError("File is too large.")
+        return zf.read(info)
+
+    def over_limit(self):
+        # Reported as an error line like any unreadable document, so a truncated batch is visible
+        raise UploadError(f"Not analyzed: a batch is limited to {BATCH_MAX_FILES} files.")
+
+    def stream(self, documents, user):
+        """Yield one NDJSON line per document in completion order.
+
+        Only a window of documents is read and analyzed at a time, so memory is
+        bounded by the pool size rather than by the batch size.
+        """
+        pool = get_document_pool()
+        window = document_workers() * 2
+        pending = set()
+        histories = []
+        exhausted = False
+
+        while True:
+            while not exhausted and len(pending) < window:
+                document = next(documents, None)
+                if document is None:
+                    exhausted = True
+                    break
+                name, content_type, read = document
+                try:
+                    data = read()
+                except Exception as e:
+                    yield json.dumps({"file_name": name, "error": str(e)}) + "\n"
+                    continue
+                pending.add(pool.submit(self.analyze_document, name, content_type, data, user))
+
+            if not pending:
+                break
+
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                line, history = future.result()
+                if history is not None:
+                    histories.append(history)
+                yield json.dumps(line, cls=DjangoJSONEncoder) + "\n"
+
+            if len(histories) >= BATCH_HISTORY_CHUNK:
+                phash.index(UploadHistory.objects.bulk_create(histories))
+                histories = []
+
+        if histories:
+            phash.index(UploadHistory.objects.bulk_create(histories))
+
+    def analyze_document(self, name, content_type, data, user):
+        if content_type not in ALLOWED_TYPES:
+            return {"file_name": name, "error": "Unsupported file type."}, None
+        metrics.uploads.inc(content_type=content_type)
+        try:
+            results = UploadView().analyze_bytes(data, content_type, name)
+            similar = phash.similar(results, user.pk if user is not None else None)
+            history = None
+            if user is not None:
+                history = UploadHistory.from_results(user, None, results)
+                history.image.save(os.path.basename(name), ContentFile(data), save=False)
+            return result_payload(results, name, similar), history
+        except Exception as e:
+            return {"file_name": name, "error": str(e)}, None
+
+
+class CacheStatsView(View):
+    def get(self, request):
+        return JsonResponse(result_cache.stats())
+
+
+class AdmissionStatsView(View):
+    def get(self, request):
+        return JsonResponse(admission.stats())
+
+
+class MetricsView(View):
+    def get(self, request):
+        if not metrics.enabled():
+            return JsonResponse({"error": "Metrics are disabled."}, status=404)
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class JobSubmitView(View):
+    def post(self, request):
+        if 'image' not in request.FILES:
+            return JsonResponse({"error": "File is missing."}, status=400)
+
+        uploaded_file = request.FILES['image']
+        password = request.POST.get("password", "").strip()
+
+        if uploaded_file.content_type not in ALLOWED_TYPES:
+            return JsonResponse({"error": "Unsupported file type."}, status=400)
+
+        metrics.uploads.inc(content_type=uploaded_file.content_type)
+        try:
+            data = b''.join(uploaded_file.chunks())
+            if uploaded_file.content_type == 'application/pdf':
+                # Store the decrypted document so the password never reaches the queue
+                data = decrypt_pdf(data, password)
+
+            job = jobs.enqueue(
+                request.user if request.user.is_authenticated else None,
+                uploaded_file.name,
+                uploaded_file.content_type,
+                data,
+            )
+            return JsonResponse({
+                "job_id": str(job.pk),
+                "state": job.status,
+                "status_url": reverse("job-status", args=[job.pk]),
+            }, status=202)
+
+        except UploadError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class JobStatusView(View):
+    def get(self, request, job_id):
+        try:
+            job = AnalysisJob.objects.get(pk=job_id)
+        except AnalysisJob.DoesNotExist:
+            return JsonResponse({"error": "Job not found."}, status=404)
+
+        if job.user_id and (not request.user.is_authenticated or request.user.pk != job.user_id):
+            return JsonResponse({"error": "Job not found."}, status=404)
+
+        if job.status == AnalysisJob.EXPIRED:
+            return JsonResponse({"error": "Job result has expired."}, status=410)
+
+        data = {
+            "job_id": str(job.pk),
+            "state": job.status,
+            "attempts": job.attempts,
+            "created_at": job.created_at.isoformat(),
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+        if job.status == AnalysisJob.DONE:
+            results = dict(job.result)
+            data["result"] = result_payload(results, job.file_name, results.pop('similar_uploads', ()))
+            data["result"]["timestamp"] = job.finished_at.isoformat()
+            data["history_id"] = job.history_id
+        elif job.status == AnalysisJob.FAILED:
+            data["error"] = job.error
+        return JsonResponse(data)
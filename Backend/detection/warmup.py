@@ -0,0 +1,48 @@
+import importlib
+import time
+
+from django.conf import settings
+
+# What detection.views defers (see lazy.LazyModule), heaviest first
+MODULES = (
+    'numpy',
+    'cv2',
+    'PyPDF2',
+    'joblib',
+    'detection.context',
+    'detection.ela',
+    'detection.localization',
+    'detection.copy_move',
+    'detection.ocr',
+    'detection.phash',
+)
+
+
+def enabled():
+    return getattr(settings, 'DETECTION_WARMUP', True)
+
+
+def warm_up(force=False):
+    """Import the forensic stack and load the classifier and OCR engines before the first upload.
+
+    Called by the WSGI/ASGI entry points (unless DETECTION_WARMUP is off) and
+    by every worker process initializer. Returns seconds spent per step.
+    """
+    if not (force or enabled()):
+        return {}
+
+    timings = {}
+
+    def step(name, fn, *args):
+        started = time.perf_counter()
+        fn(*args)
+        timings[name] = round(time.perf_counter() - started, 4)
+
+    for module in MODULES:
+        step(module, importlib.import_module, module)
+
+    from detection.ocr import get_engine
+    from detection.registry import model_registry
+    step('model', model_registry.warm_up)
+    step('ocr_engine', lambda: get_engine().warm_up())
+    return timings
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'id_tamper_detection.settings')
 
 application = get_asgi_application()
+
+from detection.warmup import warm_up
+
+warm_up()
@@ -183,4 +183,74 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWS_CREDENTIALS = True
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Detection pipeline
+DETECTION_WARMUP = True  # import the forensic stack and load the classifier/OCR engines when the WSGI/ASGI app starts
+DETECTION_MODEL_RELOAD_INTERVAL = 5  # seconds between checks of id_classifier.pkl
+DETECTION_ELA_QUALITIES = [75, 85, 90, 95]  # JPEG qualities recompressed in memory for ELA
+DETECTION_ELA_PRIMARY_QUALITY = 90  # quality whose difference feeds the verdict and the model
+DETECTION_CHECK_WORKERS = None  # shared check thread pool size; None = 2 x CPU cores (max 16)
+DETECTION_CHECK_TIMEOUT = 30  # seconds a forensic check may take before it is marked degraded
+DETECTION_CHECK_TIMEOUTS = {'text_analysis': 45}  # per-check overrides
+DETECTION_JOB_WORKERS = None  # processes started by run_detection_workers; None = CPU count
+DETECTION_JOB_MAX_ATTEMPTS = 3
+DETECTION_JOB_RETRY_DELAY = 10  # seconds, doubled on every retry
+DETECTION_JOB_LEASE = 300  # seconds before a job held by a dead worker is picked up again
+DETECTION_JOB_RESULT_TTL = 24 * 60 * 60  # seconds a finished job result stays retrievable
+
+# Detection result cache: repeat submissions of the same bytes skip the pipeline.
+# Swap the backend for 'django.core.cache.backends.filebased.FileBasedCache'
+# with LOCATION set to a directory to share entries between worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'detection_results': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'detection-results',
+        'TIMEOUT': 60 * 60,  # seconds
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+DETECTION_RESULT_CACHE_ALIAS = 'detection_results'  # None disables the result cache
+DETECTION_BATCH_WORKERS = None  # documents analyzed at once by /api/upload/batch/; None = CPU count
+DETECTION_BATCH_MAX_FILES = 500
+DETECTION_BATCH_MAX_FILE_SIZE = 20 * 1024 * 1024  # bytes, per archive member
+# Django refuses more than 100 files per request by default; a batch may carry its full limit, and the
+# files past it are reported as not analyzed (larger sets still fit in one 'archive' ZIP)
+DATA_UPLOAD_MAX_NUMBER_FILES = 2 * DETECTION_BATCH_MAX_FILES
+DETECTION_PDF_DPI = 200  # resolution PDF pages are rendered at for analysis
+DETECTION_PDF_MAX_PAGES = 10  # cap for pages=all / explicit page lists
+DETECTION_OCR_ENGINES = 2  # warm in-process tesseract APIs reused across requests (tesserocr, from requirements.txt)
+DETECTION_OCR_LANG = 'eng'
+DETECTION_OCR_TIMEOUT = 30  # seconds a request waits for a free OCR engine before text_analysis reports an error
+DETECTION_OCR_TEXT_HEIGHT = 40  # px height text-line regions are scaled to before OCR
+DETECTION_COPY_MOVE_MAX_KEYPOINTS = 4000  # SIFT cap for region matching; the model's keypoint feature is estimated uncapped
+DETECTION_COPY_MOVE_NATIVE_KEYPOINTS = False  # count the model's keypoints at full resolution (exact, but seconds on large uploads)
+DETECTION_WORKING_RESOLUTION = {  # max pixels each check works on; None = native (see detection/resolution.py)
+    'error_level_analysis': None,
+    'noise_analysis': 24_000_000,
+    'edge_analysis': 2_000_000,
+    'copy_move_detection': 2_560_000,
+    'text_analysis': 4_000_000,
+}
+DETECTION_METRICS = True  # timing spans + Prometheus text at /metrics; False makes instrumentation a no-op
+DETECTION_SPOOL_THRESHOLD = 20 * 1024 * 1024  # bytes; larger uploads are spooled to disk and memory-mapped
+FILE_UPLOAD_MAX_MEMORY_SIZE = DETECTION_SPOOL_THRESHOLD
+DETECTION_PDFTOPPM = 'pdftoppm'  # poppler binary used to render PDF pages
+DETECTION_ASYNC_PROCESSES = None  # worker processes behind the /api/async/ views; None = CPU count
+DETECTION_ASYNC_QUEUE = None  # documents handed to those processes at once; None = 2 x processes
+DETECTION_LOCALIZATION = True  # per-block ELA/noise heatmaps and suspicious-region boxes
+DETECTION_LOCALIZATION_BLOCK = None  # block side in working pixels; None = 16-128, at most 64 blocks per side
+DETECTION_DEFAULT_MODE = 'standard'  # fast = pixel checks only; standard = OCR/SIFT/ML when ambiguous; thorough = everything
+DETECTION_ADMISSION_CAPACITY = None  # weighted analyses run at once per process; None = CPU count, 0 = no limit
+DETECTION_ADMISSION_UNIT_BYTES = 4 * 1024 * 1024  # upload size that weighs one unit; PDFs weigh at least one per page
+DETECTION_ADMISSION_QUEUE = 16  # uploads that may wait for capacity before the rest get 503 + Retry-After
+DETECTION_ADMISSION_TIMEOUT = 30  # seconds an upload may wait in that queue
+DETECTION_ADMISSION_PER_USER = 2  # analyses running or queued per authenticated user before 429
+DETECTION_QTABLE_SIGNATURES = []  # known JPEG encoders: {'name', 'kind': 'camera'|'editor', 'luminance': [64 ints, row-major], 'chrominance': optional}
+DETECTION_PHASH_RADIUS = 6  # bits a photo-area hash may differ by for an earlier upload to be listed as similar
+DETECTION_PHASH_GLOBAL_RADIUS = 2  # the same for whole-image hashes; kept tight because documents share templates
+DETECTION_PHASH_MATCHES = 5  # similar earlier uploads listed per response
+DETECTION_PHASH_CANDIDATES = 200  # hash rows read per chunk query (newest first), bounding each lookup
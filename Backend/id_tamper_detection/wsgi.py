@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'id_tamper_detection.settings')
 
 application = get_wsgi_application()
+
+from detection.warmup import warm_up
+
+warm_up()
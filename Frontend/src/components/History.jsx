@@ -14,7 +14,7 @@ export default function History() {
     const fetchHistory = async () => {
       try {
         const response = await api.get("/api/auth/history/");
-        setHistory(response.data);
+        setHistory(response.data.results);
       } catch (error) {
         console.error("Error fetching history:", error);
         setError("Failed to load history. Please try again.");